@@ -0,0 +1,254 @@
+""" Measures latency and throughput of the command pipeline """
+from core.state import State
+from core.queue import Queue
+from core.service import Service
+from core.config import Config
+from core.module import ConsumingModule, create
+from core.simulator import Simulator
+
+from modules.AltecLansing.controller import Controller
+from modules.input import Input
+from modules.output import Output
+from modules.api import Api
+
+import argparse
+import threading
+import platform
+import logging
+import flask
+import time
+import json
+import sys
+import os
+
+
+class Pipeline(Simulator):
+    """ Simulator that allows to wait for output operations """
+
+    def __init__(self):
+        super().__init__()
+        self._condition = threading.Condition()
+        self._registers = {}
+
+    def register(self, register):
+        """ Gets the value last written to a register """
+        return self._registers.get(register)
+
+    def wait_for(self, predicate, timeout):
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout)
+
+    def _set_level(self, gpio, level):
+        super()._set_level(gpio, level)
+        with self._condition:
+            self._condition.notify_all()
+
+    def i2c_write_device(self, handle, data):
+        result = super().i2c_write_device(handle, data)
+        with self._condition:
+            self._registers[data[0]] = data[1]
+            self._condition.notify_all()
+        return result
+
+
+class Consumer(ConsumingModule):
+    """ Minimal consuming module without device I/O """
+
+    def __init__(self, state, queue):
+        super().__init__(None, state, queue, None, Config(value={}))
+
+
+def summarize(samples, elapsed, count):
+    """ Calculate percentiles (in microseconds) and throughput """
+
+    samples = sorted(samples)
+    return {
+        'samples': len(samples),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 1),
+        'p99_us': round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        'events_per_s': round(count / elapsed, 1),
+    }
+
+
+def measure(pi, trigger, visible, iterations, timeout=1.0):
+    """
+    Measure latency and throughput of a path
+
+    Latency is measured by triggering a single event and waiting until it is
+    visible at the output. Throughput is measured by triggering all events
+    back to back and waiting until the last one is visible. The throughput
+    run starts at an odd offset, so its last event differs from the output
+    left by the latency run.
+    """
+
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        trigger(i)
+        if not pi.wait_for(lambda: visible(i), timeout):
+            raise Exception(f'timeout in iteration {i}')
+        samples.append(time.perf_counter() - start)
+
+    offset = iterations | 1
+    last = offset + iterations - 1
+    start = time.perf_counter()
+    for i in range(offset, offset + iterations):
+        trigger(i)
+    if not pi.wait_for(lambda: visible(last), timeout):
+        raise Exception('timeout in throughput run')
+    elapsed = time.perf_counter() - start
+
+    return summarize(samples, elapsed, iterations)
+
+
+def measure_calls(call, iterations):
+    """ Measure latency and throughput of a synchronous call """
+
+    samples = []
+    begin = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - begin
+
+    return summarize(samples, elapsed, iterations)
+
+
+def benchmark_core(config, iterations):
+    """ Benchmark the core objects in isolation """
+
+    results = {}
+    queue = Queue(config.optional('commands', []), config.optional('queue', {}))
+    state = State(config.require('states'), queue)
+    consumer = Consumer(state, queue)
+    number = next(
+        element.name for element in state.properties
+        if f'{element.name}_inc' in queue.commands)
+
+    results['queue.enqueue'] = measure_calls(
+        lambda i: (queue.enqueue(f'{number}_inc'), queue.dequeue()),
+        iterations)
+
+    results['consume'] = measure_calls(
+        lambda i: (queue.enqueue(f'{number}_set', i), consumer.consume()),
+        iterations)
+
+    results['state._update'] = measure_calls(
+        lambda i: state._update(number, i), iterations)
+
+    return results
+
+
+def benchmark_pipeline(config, iterations):
+    """ Benchmark the complete pipeline on the simulator """
+
+    results = {}
+    app = flask.Flask(__name__)
+    pi = Pipeline()
+
+    queue = Queue(config.optional('commands', []), config.optional('queue', {}))
+    state = State(config.require('states'), queue)
+    service = Service(state, queue)
+
+    configs = [item.single() for item in config.require('modules').items()]
+    modules = create(pi, state, queue, app, configs)
+    for instance in modules:
+        service.register(instance)
+    service.start()
+
+    inputs = [module for module in modules if isinstance(module, Input)]
+    outputs = [module for module in modules if isinstance(module, Output)]
+    apis = [module for module in modules if isinstance(module, Api)]
+
+    # input (switch) -> command -> state -> output pin
+    if inputs and outputs:
+        input, output = inputs[0]._pin, outputs[0]._pin
+
+        # start with the switch off and alternate from there
+        pi.inject(input.number, 0 ^ input.invert)
+        results['input->output'] = measure(
+            pi,
+            lambda i: pi.inject(
+                input.number, (i + 1) % 2 ^ input.invert, pi.advance(1000)),
+            lambda i: pi.read(output.number) == ((i + 1) % 2 ^ output.invert),
+            iterations)
+
+    # api -> command -> state -> controller -> I2C
+    controllers = [m for m in modules if isinstance(m, Controller)]
+    if apis and controllers:
+        client = app.test_client()
+        client.post('/command', json={
+            'command': 'power_set', 'params': {'power': True}, 'wait': True})
+
+        results['api->i2c'] = measure(
+            pi,
+            lambda i: client.post('/command', json={
+                'command': 'volume_set', 'params': {'volume': i % 50 + 1}}),
+            lambda i: pi.register(Controller.CMD_VOLUME) ==
+            Controller.MIN_VOL - (i % 50 + 1),
+            iterations)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Report paths whose p99 latency regressed by more than tolerance """
+
+    regressions = []
+    for path, result in results.items():
+        previous = baseline.get('results', {}).get(path)
+        if previous is None:
+            continue
+        if result['p99_us'] > previous['p99_us'] * (1 + tolerance):
+            regressions.append(
+                f'{path}: p99 {previous["p99_us"]}us -> {result["p99_us"]}us')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    config = Config.load(args.config)
+
+    results = benchmark_core(config, args.iterations)
+    results.update(benchmark_pipeline(config, args.iterations))
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': args.config,
+        'iterations': args.iterations,
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    for path, result in results.items():
+        print(f'{path:16} p50 {result["p50_us"]:>9}us  '
+              f'p99 {result["p99_us"]:>9}us  '
+              f'{result["events_per_s"]:>10}/s')
+
+    code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        code = 1 if regressions else 0
+
+    # service threads are not meant to be stopped
+    sys.stdout.flush()
+    os._exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from .service import Worker
+
+import collections
+import threading
+import logging
+import json
+
+
+class Broadcaster:
+    """
+    Streams state changes to an arbitrary number of subscribers
+
+    A single thread waits for state changes and serializes the changed values
+    once as server-sent event. The encoded frames are kept in a short history,
+    from which every subscriber reads the frames it did not see yet. Slow
+    subscribers that fell behind the history receive the complete state.
+    """
+
+    def __init__(self, state, history=64):
+        self._state = state
+        self._frames = collections.deque(maxlen=history)
+        self._version = state.version
+        self._condition = threading.Condition()
+        self._listeners = []
+        self._worker = Worker(self._loop, 'broadcast thread')
+
+    @property
+    def version(self):
+        return self._version
+
+    @staticmethod
+    def encode(version, values):
+        """ Encode values as server-sent event """
+        return f'id: {version}\nevent: state\ndata: {json.dumps(values)}\n\n'.encode()
+
+    def start(self):
+        """ Start broadcasting (if not running already) """
+        if not self._worker.running:
+            self._worker.start()
+
+    def listen(self, callback):
+        """ Register callback invoked with the version of every new frame """
+        self._listeners.append(callback)
+
+    def _loop(self, cycle, worker):
+        """ Serialize every state change once """
+
+        version = self._version
+        while cycle == worker.cycle:
+            self._state.wait_for(version)
+            previous = version
+            version, values = self._state.delta(previous)
+            if not values:
+                continue
+
+            frame = Broadcaster.encode(version, values)
+            with self._condition:
+                self._frames.append((previous, version, frame))
+                self._version = version
+                self._condition.notify_all()
+
+            for callback in self._listeners:
+                callback(version)
+
+    def wait_for(self, version, timeout=None):
+        """ Waits until a frame newer than the given version is available """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout)
+            return self._version
+
+    def read(self, since=None):
+        """
+        Gets the current version and all frames newer than the given version
+
+        If the given version is unknown or too old, a single frame containing
+        the complete state is returned instead. Versions newer than the
+        current one are unknown as well, since versions restart with every
+        process (e.g. a client reconnecting after a restart).
+        """
+
+        with self._condition:
+            if since is not None and since == self._version:
+                return self._version, []
+
+            frames = [
+                frame for previous, version, frame in self._frames
+                if version > since
+            ] if since is not None else None
+
+            # history covers all changes since the given version
+            if frames and self._frames[-len(frames)][0] <= since:
+                return self._version, frames
+
+        logging.debug(f'sending complete state (since {since})')
+        version, values = self._state.snapshot()
+        return version, [Broadcaster.encode(version, values)]
@@ -10,6 +10,12 @@ class Pin:
         self._invert = descriptor[0] == '!'
         self._number = int(descriptor.strip('!'))
 
+    @staticmethod
+    def valid(descriptor):
+        """ Checks whether a descriptor (e.g. "!17") is a pin """
+        return isinstance(descriptor, str) and descriptor.lstrip(
+            '!').isdigit()
+
     @property
     def invert(self):
         return self._invert
@@ -27,6 +33,9 @@ class Config:
     Key = '__key__'
     Value = '__value__'
 
+    # classes resolved by oftype
+    _types = {}
+
     def __init__(self, key=None, value=None):
         self._key = key
         self._value = value
@@ -56,6 +65,8 @@ class Config:
     def optional(self, key=None, fallback=None):
         if key is None:
             raise Exception('Parameter key must not be None')
+        if self._value is None:
+            return Config(key, fallback)
         return Config(key, self._value.get(key, fallback))
 
     def items(self):
@@ -88,7 +99,18 @@ class Config:
         return options[value]
 
     def oftype(self, key, module, base):
+        """
+        Import the class referenced by key
+
+        The python module is only imported upon first use, so dependencies
+        of unused modules are never loaded. Resolved classes are cached.
+        """
+
         submodule = self.require(key).value
+        type = Config._types.get((module, submodule))
+        if type is not None:
+            return type
+
         try:
             library = importlib.import_module(f'{module}.{submodule}')
             type_name = submodule.split('.')[-1].capitalize()
@@ -96,6 +118,8 @@ class Config:
             assert(issubclass(type, base))
         except:
             raise Exception(f'Invalid value "{submodule}" for "{key}"')
+
+        Config._types[(module, submodule)] = type
         return type
 
     def pin(self, key):
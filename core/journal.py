@@ -0,0 +1,55 @@
+""" Contains an in-memory log of structured events """
+import collections
+import time
+
+
+class Journal:
+    """
+    Keeps the most recent events in memory
+
+    Recording an event only appends a tuple to a bounded deque, so it is cheap
+    enough for hot paths. Events are formatted only when the journal is dumped
+    (e.g. by the api module), instead of being written to disk continuously.
+    """
+
+    def __init__(self, capacity=256):
+        self._events = collections.deque(maxlen=capacity)
+
+    def resize(self, capacity):
+        """ Change the number of events kept (0 disables the journal) """
+        self._events = collections.deque(self._events, maxlen=capacity)
+
+    def record(self, module, command, *args):
+        """ Record an event """
+        self._events.append((time.time(), module, command, args))
+
+    @staticmethod
+    def _plain(value):
+        """ Convert a value to be JSON serializable """
+
+        if isinstance(value, (bytes, bytearray)):
+            return value.hex()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, dict):
+            return {str(key): Journal._plain(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [Journal._plain(item) for item in value]
+        return str(value)
+
+    def dump(self):
+        """ Gets all recorded events (oldest first) """
+
+        return [
+            {
+                'timestamp': timestamp,
+                'module': module,
+                'command': Journal._plain(command),
+                'args': Journal._plain(args),
+            }
+            for timestamp, module, command, args in list(self._events)
+        ]
+
+
+# global journal
+journal = Journal()
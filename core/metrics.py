@@ -0,0 +1,117 @@
+""" Contains lightweight instrumentation exposed in Prometheus text format """
+import threading
+import bisect
+
+
+class Counter:
+    """ Monotonically increasing value """
+
+    def __init__(self):
+        self._value = 0
+
+    def inc(self, amount=1):
+        self._value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self._value
+
+
+class Histogram:
+    """ Distribution of observed values (e.g. durations in seconds) """
+
+    Buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self, buckets=Buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._sum += value
+
+    def samples(self, name, labels):
+        count = 0
+        for bound, bucket in zip(self._buckets, self._counts):
+            count += bucket
+            yield f'{name}_bucket', labels + (('le', str(bound)),), count
+        count += self._counts[-1]
+        yield f'{name}_bucket', labels + (('le', '+Inf'),), count
+        yield f'{name}_sum', labels, self._sum
+        yield f'{name}_count', labels, count
+
+
+class Callback:
+    """ Value collected when the metrics are exported """
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def samples(self, name, labels):
+        yield name, labels, self._callback()
+
+
+class Metrics:
+    """
+    Registry of all metrics
+
+    Instrumentation is disabled by default. Hot paths check enabled before
+    taking timestamps or updating metrics, so the overhead is a single
+    attribute lookup when disabled. Metrics are identified by name and an
+    optional set of labels and created upon first use.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def _get(self, type, kind, name, help, labels, *args):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is None or key not in family[2]:
+            with self._lock:
+                family = self._families.setdefault(name, (kind, help, {}))
+                family[2].setdefault(key, type(*args))
+        return family[2][key]
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, 'counter', name, help, labels)
+
+    def histogram(self, name, help='', **labels):
+        return self._get(Histogram, 'histogram', name, help, labels)
+
+    def register(self, name, kind, callback, help='', **labels):
+        """ Register a value that is collected upon export """
+        self._get(Callback, kind, name, help, labels, callback)
+
+    def export(self):
+        """ Export all metrics in Prometheus text format """
+
+        lines = []
+        with self._lock:
+            families = [
+                (name, kind, help, list(series.items()))
+                for name, (kind, help, series) in self._families.items()
+            ]
+
+        for name, kind, help, series in families:
+            if help:
+                lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, metric in series:
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    if sample_labels:
+                        formatted = ','.join(
+                            f'{key}="{label}"' for key, label in sample_labels)
+                        sample = f'{sample}{{{formatted}}}'
+                    lines.append(f'{sample} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# global registry
+metrics = Metrics()
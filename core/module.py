@@ -1,8 +1,25 @@
 """ Contains base interfaces for modules """
+from .queue import Queue
+from .config import Config
+from .metrics import metrics
+
+import concurrent.futures
+import logging
+import time
 
 
 class Module:
-    """ Base class for modules """
+    """
+    Base class for modules
+
+    The options of a module are checked by the config validator against
+    "Options" (for modules configured by a mapping) or "Items" (for every
+    item of modules configured by a list). Both are tuples of
+    (key, required, types, condition).
+    """
+
+    Options = ()
+    Items = ()
 
     def __init__(self, pi, state, queue, app, config):
         self._pi = pi
@@ -10,17 +27,55 @@ class Module:
         self._queue = queue
         self._app = app
         self._config = config
+        self._subscriptions = None
+
+    @property
+    def subscriptions(self):
+        """ Gets the properties this module is interested in (None for all) """
+        return self._subscriptions
+
+    def _subscribe(self, *properties):
+        """ Only receive updates for changes of the given properties """
+        if self._subscriptions is None:
+            self._subscriptions = set()
+        self._subscriptions.update(properties)
 
     def command(self, command, *args, **kwargs):
-        """ Enqueue a command """
-        self._queue.enqueue(command, *args, **kwargs)
+        """ Enqueue a command (returns False if it was rejected) """
+        if self._queue.enqueue(command, *args, **kwargs):
+            return True
+        logging.warning('%s rejected %s()', type(self).__name__, command)
+        return False
+
+    def _resolve(self, method, value=None):
+        """
+        Resolve a configured method to a command and its arguments
+
+        Command.X is the command X (with value as argument), State.Action is
+        the command <value>_<action> and Target.Action is <target>_<action>.
+        """
 
-    def update(self):
+        target, _, action = method.partition('.')
+        if target == 'Command':
+            command, args = action, () if value is None else (value,)
+        elif target == 'State':
+            command, args = f'{value}_{action.lower()}', ()
+        else:
+            command = f'{target.lower()}_{action.lower()}'
+            args = () if value is None else (value,)
+
+        if command not in self._queue.commands:
+            raise Exception(f'Unknown command {command}() for "{method}"')
+        return command, args
+
+    def update(self, changes=None):
         """ 
         Called upon state changes 
 
-        It is ensured that update is called once after initialization to allow
-        the component to find it's initial state.
+        The changes contain the names of all subscribed properties that changed
+        since the last update. It is ensured that update is called once after
+        initialization (with changes being None) to allow the component to find
+        it's initial state.
         """
         pass
 
@@ -30,11 +85,26 @@ class PollingModule(Module):
     Base class for polling modules
 
     A polling module is added to the applications polling loop.
-    It's poll() method is executed once every cycle.
+    It's poll() method is executed once every period (in seconds), which can
+    be adjusted using the "period" option. Modules with a period of None are
+    only polled when they call wake(), e.g. from an interrupt callback.
     """
 
+    Period = 0.05
+
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
+        self._period = config.optional('period', self.Period).value
+        self._scheduler = None
+
+    @property
+    def period(self):
+        return self._period
+
+    def wake(self):
+        """ Request the module to be polled as soon as possible """
+        if self._scheduler is not None:
+            self._scheduler.wake(self)
 
     def poll(self):
         """ Called in main polling loop """
@@ -47,11 +117,42 @@ class ConsumingModule(Module):
 
     The consuming module is registered as the applications main module.
     It works the command queue and executes the incoming commands.
+
+    Multiple devices can be controlled by a single process by giving each
+    consuming module a "namespace". Its properties and commands are then
+    prefixed with the namespace (e.g. livingroom.volume_set) and it works
+    its own partition of the queue.
     """
 
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
+        self._namespace = config.optional('namespace').value
+        self._partition = queue.partition(self._namespace)
         self._commands = {}
+        self._handlers = queue.compile(self._commands)
+        self._deferred = None
+
+    @property
+    def namespace(self):
+        return self._namespace
+
+    @property
+    def partition(self):
+        return self._partition
+
+    def _name(self, name):
+        """ Prefix a property or command name with the namespace """
+        if self._namespace is None:
+            return name
+        return f'{self._namespace}.{name}'
+
+    def _value(self, property):
+        """ Gets the value of a property of this device """
+        return self._state.get(self._name(property))
+
+    def command(self, command, *args, **kwargs):
+        """ Enqueue a command of this device """
+        return super().command(self._name(command), *args, **kwargs)
 
     def _register_commands(self, **kwargs):
         """
@@ -60,7 +161,10 @@ class ConsumingModule(Module):
         The handlers will be automatically invoced, whenever a command is enqueued.
         TODO: Compare known handlers to commands provided in config.
         """
-        self._commands = kwargs
+        self._commands = {
+            self._name(command): handler for command, handler in kwargs.items()
+        }
+        self._handlers = self._queue.compile(self._commands)
 
     def _update_state(self, property, value):
         """ 
@@ -70,18 +174,120 @@ class ConsumingModule(Module):
         Therefore this method is hidden here.
         """
 
-        if(self._state._update(property, value)):
+        if(self._state._update(self._name(property), value)):
             self._state._notify()
             return True
 
         return False
 
+    def _defer(self, callback):
+        """
+        Run callback once the current transaction is complete
+
+        Used to flush device I/O once per transaction instead of once per
+        command. Outside of transactions the callback is run immediately.
+        """
+
+        if self._deferred is None:
+            callback()
+        else:
+            self._deferred[callback] = None
+
+    def _handler(self, command):
+        """
+        Gets the handler of a command
+
+        Handlers are resolved once when the commands are registered. Commands
+        registered later on are resolved upon first use.
+        """
+
+        handler = self._handlers.get(command)
+        if handler is None:
+            handler = self._commands.get(command)
+            if handler is None:
+                handler = self._queue.commands.get(command)
+            if handler is None:
+                raise Exception(f'No handler for {command}()')
+            self._handlers[command] = handler
+        return handler
+
+    def _execute(self, command):
+        """ Execute a command and all derived commands """
+
+        command.execute(self._handler(command.name), self._handler)
+
+    def _transact(self, commands):
+        """ Execute multiple commands as a single transaction """
+
+        self._deferred = {}
+        try:
+            with self._state._transaction():
+                for command in commands:
+                    self._execute(command)
+        finally:
+            deferred, self._deferred = self._deferred, None
+
+        for callback in deferred:
+            callback()
+
     def consume(self):
         """ Execute all commands from queue """
 
-        while not self._queue.drained:
-            command = self._queue.dequeue()
+        while not self._partition.drained:
+            item = self._partition.dequeue()
+
+            # a failing command must not stop the queue thread
+            try:
+                if isinstance(item, Queue.Transaction):
+                    self._transact(item.commands)
+                else:
+                    self._execute(item)
+            except Exception:
+                logging.exception('%s failed to execute %s',
+                                  type(self).__name__, item.name)
+
+
+def create(pi, state, queue, app, configs, workers=8):
+    """
+    Import and construct modules concurrently
+
+    Initialization of a module often blocks on its device (e.g. I2C
+    synchronization or opening a serial port), so independent modules are
+    constructed in a thread pool. The modules are returned in config order,
+    the time each one took is logged and exported as a metric.
+    """
+
+    def construct(config):
+        start = time.perf_counter()
+        type = config.oftype(Config.Key, 'modules', base=Module)
+        instance = type(pi, state, queue, app, config)
+        return instance, time.perf_counter() - start
+
+    begin = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(construct, config) for config in configs]
+
+    instances, errors = [], []
+    for index, (config, future) in enumerate(zip(configs, futures)):
+        name = config.require(Config.Key).value
+        try:
+            instance, elapsed = future.result()
+        except Exception as error:
+            logging.error('failed to initialize %s: %s', name, error)
+            errors.append(name)
+            continue
+
+        logging.info('initialized %s in %.0fms', name, elapsed * 1000)
+        metrics.register(
+            'raspeaker_module_init_seconds', 'gauge',
+            lambda elapsed=elapsed: elapsed,
+            'Time taken to initialize a module',
+            module=name, index=str(index))
+        instances.append(instance)
+
+    if errors:
+        raise Exception(f'Failed to initialize {", ".join(errors)}')
 
-            while command is not None:
-                override = self._commands.get(command.name)
-                command = command.execute(override)
+    logging.info('initialized %s modules in %.0fms',
+                 len(instances), (time.perf_counter() - begin) * 1000)
+    return instances
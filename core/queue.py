@@ -1,53 +1,358 @@
+from .config import Config
+from .metrics import metrics
+from .journal import journal
+
+import collections
+import functools
 import threading
+import inspect
 import logging
+import time
 
 
 class Queue:
-    """ 
-    Stores commands sent to the device 
+    """
+    Stores commands sent to the device
 
     Whenever a module wants to change the state, it has to do so using commands.
-    The command can be consumed by the main module in order to run further logic 
+    The command can be consumed by the main module in order to run further logic
     that is required to control the physical device.
 
     The queue does provide a thread-lock that allows to wait for new commands.
+
+    The queue is bounded. If it is full, the configured policy decides whether
+    the oldest command is dropped, the new command is rejected or the caller
+    blocks until the consumer made room. Commands registered as coalescing
+    (e.g. all *_set commands) are not queued twice: if the last pending
+    command of its lane is the same command, it is updated with the latest
+    arguments instead. Otherwise the command is queued again, so it still
+    runs after all commands that were queued before it.
+
+    Multiple commands can be enqueued as a single transaction, which is
+    executed by the consuming module as a whole.
+
+    Commands can be given a priority (default 0). Pending commands of higher
+    priority are consumed first, so e.g. power_set is not delayed by a flood
+    of volume_inc commands. If the queue is full, the oldest command of the
+    lowest priority is dropped, or the new command if its priority is below
+    that of all pending commands.
+
+    The queue is split into partitions, one per consuming module. Commands
+    are routed by their namespace (e.g. livingroom.volume_set), all other
+    commands end up in the default partition (namespace None).
     """
 
+    DropOldest = 'drop-oldest'
+    Reject = 'reject'
+    Block = 'block'
+
     class Command:
         def __init__(self, command, handler, args, kwargs):
             self._command = command
             self._handler = handler
             self._args = args
             self._kwargs = kwargs
+            self._enqueued = None
+            self._timestamp = None
 
         @property
         def name(self):
             return self._command
 
-        def execute(self, override=None):
+        def _replace(self, item):
+            """ Replace arguments of a pending command """
+            self._args = item._args
+            self._kwargs = item._kwargs
+            self._timestamp = item._timestamp
+
+        def execute(self, override=None, resolve=None):
+            """
+            Execute the command and all derived commands
+
+            A handler may return a (command, args) tuple to continue with
+            another command. Derived commands are called directly through
+            resolve(name), which returns the handler of a command, without
+            queueing or wrapping them again. Timestamped commands pass the
+            time they were enqueued at to handlers that take a "timestamp".
+            """
+
             if override is None:
                 override = self._handler
             if override is None:
                 raise Exception(f'No handler for {self._command}()')
+            if resolve is None:
+                resolve = Queue.Command._resolve
+
+            kwargs = self._kwargs
+            if self._timestamp is not None and Queue.Command._stamps(override):
+                kwargs = dict(kwargs, timestamp=self._timestamp)
 
             logging.debug(
-                f'execute {self._command}({self._args}, {self._kwargs})')
-            derivate = override(*self._args, **self._kwargs)
-            if derivate is None:
-                return None
+                'execute %s(%s, %s)', self._command, self._args, self._kwargs)
+            if self._kwargs:
+                journal.record(
+                    'queue', self._command, *self._args, self._kwargs)
+            else:
+                journal.record('queue', self._command, *self._args)
+
+            if not metrics.enabled:
+                Queue.Command._chain(override(*self._args, **kwargs), resolve)
+                return
+
+            start = time.perf_counter()
+            if self._enqueued is not None:
+                metrics.histogram(
+                    'raspeaker_command_delay_seconds',
+                    'Time from enqueueing to execution',
+                    command=self._command).observe(start - self._enqueued)
+            Queue.Command._chain(override(*self._args, **kwargs), resolve)
+            metrics.histogram(
+                'raspeaker_command_duration_seconds',
+                'Execution time of commands (including derived commands)',
+                command=self._command).observe(time.perf_counter() - start)
+
+        @staticmethod
+        def _chain(derivate, resolve):
+            """ Run derived commands until a handler returns None """
+
+            while derivate is not None:
+                command, args = derivate
+                journal.record('queue', command, *args)
+                derivate = resolve(command)(*args)
+
+        @staticmethod
+        @functools.lru_cache(maxsize=None)
+        def _stamps(handler):
+            """ Checks whether a handler takes the "timestamp" keyword """
+            try:
+                return 'timestamp' in inspect.signature(handler).parameters
+            except (TypeError, ValueError):
+                return False
+
+        @staticmethod
+        def _resolve(command):
+            raise Exception(f'No handler for {command}()')
+
+    class Partition:
+        """
+        Pending commands of a single consuming module
+
+        Commands are kept in one lane per priority. Lanes are consumed in
+        order of descending priority, commands within a lane in FIFO order.
+        """
+
+        def __init__(self, namespace, capacity, policy):
+            self._namespace = namespace
+            self._capacity = capacity
+            self._policy = policy
+            self._pending = {}
+            self._event = threading.Event()
+            self._lock = threading.Lock()
+            self._space = threading.Condition(self._lock)
+            self._lanes = {}
+            self._order = []
+            self._length = 0
+            self._statistics = {}
+
+        @property
+        def namespace(self):
+            return self._namespace
+
+        @property
+        def drained(self):
+            """ Checks whether the partition is empty """
+
+            return not self._length
+
+        @property
+        def statistics(self):
+            """ Gets pending, dequeued and dropped commands per priority """
+
+            with self._lock:
+                return {
+                    priority: {
+                        'pending': len(self._lanes[priority]),
+                        **statistics,
+                    }
+                    for priority, statistics in self._statistics.items()
+                }
+
+        def __len__(self):
+            return self._length
+
+        def _lane(self, priority):
+            """ Gets (or creates) the lane of a priority (lock must be held) """
+
+            lane = self._lanes.get(priority)
+            if lane is None:
+                lane = self._lanes[priority] = collections.deque()
+                self._statistics[priority] = {'dequeued': 0, 'dropped': 0}
+                self._order = sorted(self._lanes, reverse=True)
+
+                labels = {
+                    'partition': self._namespace or 'default',
+                    'priority': str(priority),
+                }
+                metrics.register(
+                    'raspeaker_queue_length', 'gauge', lambda: len(lane),
+                    'Number of pending commands', **labels)
+                metrics.register(
+                    'raspeaker_queue_dequeued_total', 'counter',
+                    lambda: self._statistics[priority]['dequeued'],
+                    'Number of dequeued commands', **labels)
+            return lane
+
+        def _drop_oldest(self, command, priority):
+            """
+            Remove the oldest command of the lowest priority
+
+            Pending commands of higher priority than the new command are
+            never dropped for it, the new command is dropped instead.
+            Returns False in that case.
+            """
+
+            for lowest in reversed(self._order):
+                if self._lanes[lowest]:
+                    break
+            if lowest > priority:
+                self._lane(priority)
+                self._statistics[priority]['dropped'] += 1
+                if metrics.enabled:
+                    Queue._count('dropped')
+                logging.warning(f'queue full, dropped {command}()')
+                return False
+
+            dropped = self._lanes[lowest].popleft()
+            self._length -= 1
+            self._statistics[lowest]['dropped'] += 1
+            if self._pending.get(dropped.name) is dropped:
+                del self._pending[dropped.name]
+            if metrics.enabled:
+                Queue._count('dropped')
+            logging.warning(f'queue full, dropped {dropped.name}()')
+            return True
+
+        def _make_room(self, command, priority):
+            """ Apply the backpressure policy (lock must be held) """
+
+            if self._length < self._capacity:
+                return True
+
+            if self._policy == Queue.Reject:
+                logging.warning(f'queue full, rejected {command}()')
+                if metrics.enabled:
+                    Queue._count('rejected')
+                return False
+            elif self._policy == Queue.Block:
+                self._space.wait_for(
+                    lambda: self._length < self._capacity)
+            else:
+                return self._drop_oldest(command, priority)
+
+            return True
+
+        def put(self, item, priority=0, coalesce=False):
+            """
+            Add a command or transaction
+
+            Returns False if it was rejected because the partition is full.
+            """
+
+            with self._lock:
 
-            # return derived command that is executed afterwards
-            (command, args) = derivate
-            logging.debug(f'continue with {command}({args})')
-            return Queue.Command(command, None, args, {})
+                # update pending command instead of queueing it again (only
+                # if nothing was queued after it, so the last write wins)
+                pending = self._pending.get(item.name) if coalesce else None
+                lane = self._lanes.get(priority)
+                if pending is not None and lane and lane[-1] is pending:
+                    pending._replace(item)
+                    self._event.set()
+                    if metrics.enabled:
+                        Queue._count('coalesced')
+                    return True
 
-    def __init__(self, config):
+                if not self._make_room(item.name, priority):
+                    return False
+
+                self._lane(priority).append(item)
+                self._length += 1
+                if coalesce:
+                    self._pending[item.name] = item
+
+            self._event.set()
+            return True
+
+        def dequeue(self):
+            """ Dequeues the next command of the highest priority """
+
+            with self._lock:
+                if not self._length:
+                    return None
+
+                for priority in self._order:
+                    lane = self._lanes[priority]
+                    if lane:
+                        break
+
+                item = lane.popleft()
+                self._length -= 1
+                self._statistics[priority]['dequeued'] += 1
+                if self._pending.get(item.name) is item:
+                    del self._pending[item.name]
+                self._space.notify()
+                return item
+
+        def clear(self):
+            """ Clears the queue event """
+
+            self._event.clear()
+
+        def wait(self):
+            """ Waits for a new command """
+
+            self._event.wait()
+
+    class Transaction:
+        def __init__(self, commands):
+            self._commands = commands
+
+        @property
+        def name(self):
+            return 'transaction'
+
+        @property
+        def commands(self):
+            return self._commands
+
+    def __init__(self, config, options=None):
         self._commands = {}
-        self._event = threading.Event()
-        self._queue = []
+        self._coalescing = set()
+        self._timestamped = set()
+        self._priorities = {}
+        self._partitions = {}
+        self._lock = threading.Lock()
 
-        for item in config.values():
-            self.register(item)
+        if options is None or options.value is None:
+            options = Config(value={})
+        self._capacity = int(options.optional('capacity', 64).value)
+        self._policy = options.optional('policy', Queue.DropOldest).value
+        if self._policy not in (Queue.DropOldest, Queue.Reject, Queue.Block):
+            raise Exception(f'Invalid queue policy "{self._policy}"')
+        if self._capacity < 1:
+            raise Exception(f'Invalid queue capacity {self._capacity}')
+
+        self._default = self.partition(None)
+
+        for item in config.items():
+            if isinstance(item.value, dict):
+                # command with options
+                item = item.single()
+                options = item.value or {}
+                self.register(item.require(Config.Key).value,
+                              coalesce=options.get('coalesce', False),
+                              priority=int(options.get('priority', 0)))
+            else:
+                self.register(item.value)
 
     @ property
     def commands(self):
@@ -57,42 +362,167 @@ class Queue:
 
     @ property
     def drained(self):
-        """ Checks whether the queue is empty """
+        """ Checks whether the default partition is empty """
+
+        return self._default.drained
+
+    @ property
+    def capacity(self):
+        """ Gets the maximum number of pending commands per partition """
 
-        return not self._queue
+        return self._capacity
 
-    def register(self, command, handler=None):
-        """ Register a new command """
+    def __len__(self):
+        return sum(len(partition) for partition in self._partitions.values())
+
+    def partition(self, namespace):
+        """ Gets (or creates) the partition for the given namespace """
+
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                partition = Queue.Partition(
+                    namespace, self._capacity, self._policy)
+                self._partitions[namespace] = partition
+            return partition
+
+    def compile(self, overrides):
+        """
+        Resolve the handler of every registered command
+
+        Handlers given in overrides (e.g. by the consuming module) take
+        precedence over the registered ones. Commands without any handler
+        are left out.
+        """
+
+        handlers = {
+            command: handler
+            for command, handler in self._commands.items()
+            if handler is not None
+        }
+        handlers.update(overrides)
+        return handlers
+
+    @ property
+    def statistics(self):
+        """ Gets the lane statistics of all partitions """
+
+        return {
+            namespace: partition.statistics
+            for namespace, partition in self._partitions.items()
+        }
+
+    def _route(self, command):
+        """ Gets the partition responsible for a command """
+
+        namespace, separator, _ = command.partition('.')
+        if separator:
+            return self._partitions.get(namespace, self._default)
+        return self._default
+
+    def register(self, command, handler=None, coalesce=False, priority=None,
+                 timestamped=False):
+        """
+        Register a new command
+
+        Commands can be registered without handler first (e.g. from config)
+        and receive their handler later on. Coalescing and priority are sticky.
+        Timestamped commands keep the time they were enqueued at
+        (time.monotonic), which is passed as "timestamp" keyword argument to
+        handlers that take it.
+        """
 
         registered = self._commands.get(command)
         if registered is not None:
             raise Exception(f'Multiple handlers for {command}()')
 
         self._commands[command] = handler
+        if coalesce:
+            self._coalescing.add(command)
+        if priority is not None:
+            self._priorities[command] = priority
+        if timestamped:
+            self._timestamped.add(command)
         logging.debug(f'registered {command}()')
 
     def enqueue(self, command, *args, **kwargs):
-        """ Enqueues a new command """
+        """
+        Enqueues a new command
+
+        Returns False if the command was rejected because the queue is full.
+        """
 
         if command not in self._commands:
             raise Exception(f'Unknown command {command}()')
 
         handler = self._commands[command]
-        self._queue.append(Queue.Command(command, handler, args, kwargs))
-        self._event.set()
+        item = Queue.Command(command, handler, args, kwargs)
+        if command in self._timestamped:
+            item._timestamp = time.monotonic()
+        if metrics.enabled:
+            item._enqueued = time.perf_counter()
+            Queue._count('enqueued')
+
+        return self._route(command).put(
+            item, self._priorities.get(command, 0),
+            command in self._coalescing)
+
+    def transact(self, commands):
+        """
+        Enqueues multiple commands as a single transaction
+
+        The commands are given as (command, args, kwargs) tuples and must
+        belong to the same partition. The transaction takes the highest
+        priority of its commands. Returns False if the transaction was
+        rejected because the queue is full.
+        """
+
+        items = []
+        priority = 0
+        partitions = set()
+        timestamp = time.monotonic()
+        for command, args, kwargs in commands:
+            if command not in self._commands:
+                raise Exception(f'Unknown command {command}()')
+            handler = self._commands[command]
+            item = Queue.Command(command, handler, args, kwargs)
+            if command in self._timestamped:
+                item._timestamp = timestamp
+            items.append(item)
+            priority = max(priority, self._priorities.get(command, 0))
+            partitions.add(self._route(command))
+
+        if len(partitions) > 1:
+            raise Exception('Transaction must not span multiple namespaces')
+        if not items:
+            return True
+
+        if metrics.enabled:
+            now = time.perf_counter()
+            for item in items:
+                item._enqueued = now
+            Queue._count('enqueued', len(items))
+
+        return partitions.pop().put(Queue.Transaction(items), priority)
+
+    @staticmethod
+    def _count(result, amount=1):
+        metrics.counter(
+            'raspeaker_queue_commands_total',
+            'Number of commands by enqueue result',
+            result=result).inc(amount)
 
     def dequeue(self):
-        """ Dequeues the next command """
+        """ Dequeues the next command of the default partition """
 
-        if self._queue:
-            return self._queue.pop(0)
+        return self._default.dequeue()
 
     def clear(self):
-        """ Clears the queue event """
+        """ Clears the event of the default partition """
 
-        self._event.clear()
+        self._default.clear()
 
     def wait(self):
-        """ Waits for a new command """
+        """ Waits for a new command in the default partition """
 
-        self._event.wait()
+        self._default.wait()
@@ -0,0 +1,326 @@
+""" Contains the validated and cached representation of YAML configs """
+from .config import Config
+from .module import Module as Base
+
+import importlib.util
+import dataclasses
+import hashlib
+import logging
+import pickle
+import yaml
+import os
+
+
+Backends = ('pigpio', 'simulator')
+Policies = ('drop-oldest', 'reject', 'block')
+Levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# numeric state options as (key, default, types, condition)
+Limits = (
+    ('step', 1, int, lambda step: step > 0),
+    ('acceleration', 1, int, lambda acceleration: acceleration >= 1),
+    ('interval', 0.1, (int, float), lambda interval: interval > 0),
+)
+
+# bumped whenever the cached representation changes
+Version = 4
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Command:
+    name: str
+    coalesce: bool = False
+    priority: int = 0
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class State:
+    name: str
+    type: str
+    initial: object = None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Module:
+    type: str
+    options: object = None
+
+    @property
+    def config(self):
+        return Config(self.type, self.options)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    Validated configuration
+
+    Holds the settings used by the core and the parsed document, which is
+    still handed to the core objects and modules as Config.
+    """
+
+    backend: str
+    metrics: bool
+    level: str
+    journal: int
+    capacity: int
+    policy: str
+    commands: tuple
+    states: tuple
+    modules: tuple
+    document: dict
+
+    @property
+    def config(self):
+        return Config(value=self.document)
+
+
+class Validator:
+    """ Collects all errors of a config instead of stopping at the first """
+
+    def __init__(self):
+        self._errors = []
+
+    @property
+    def errors(self):
+        return self._errors
+
+    def error(self, path, message):
+        self._errors.append(f'{path}: {message}')
+
+    def check(self, path, value, types, condition=None, message=None):
+        """ Check the type of a value and optionally condition(value) """
+
+        types = types if isinstance(types, tuple) else (types,)
+        valid = isinstance(value, types) and (
+            not isinstance(value, bool) or bool in types or object in types)
+        if valid and condition is not None:
+            valid = condition(value)
+        if not valid:
+            self.error(path, message or f'invalid value {value!r}')
+        return valid
+
+    def mapping(self, path, value):
+        """ Gets a section that must be a mapping (or empty) """
+
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            self.error(path, 'expected a mapping')
+            return {}
+        return value
+
+    def options(self, path, options, schema):
+        """ Check the options of a module against its schema """
+
+        for key, required, types, condition in schema:
+            value = options.get(key)
+            if value is None:
+                if required:
+                    self.error(f'{path}.{key}', 'required')
+            else:
+                self.check(f'{path}.{key}', value, types, condition)
+
+    def command(self, path, item):
+        if isinstance(item, str):
+            return Command(item)
+        if not isinstance(item, dict) or len(item) != 1:
+            self.error(path, 'expected a name or a single mapping')
+            return None
+
+        name, options = next(iter(item.items()))
+        options = self.mapping(f'{path}.{name}', options)
+        coalesce = options.get('coalesce', False)
+        priority = options.get('priority', 0)
+        self.check(f'{path}.{name}.coalesce', coalesce, bool)
+        self.check(f'{path}.{name}.priority', priority, int)
+        return Command(name, coalesce, priority)
+
+    def state(self, path, name, options):
+        options = self.mapping(path, options)
+        type = options.get('type')
+        initial = options.get('initial')
+
+        if type == 'number':
+            bounds = options.get('range', [0, 100])
+            valid = self.check(f'{path}.range', bounds, list, lambda bounds: (
+                len(bounds) == 2 and bounds[0] <= bounds[1] and all(
+                    isinstance(bound, (int, float)) for bound in bounds)))
+            if initial is not None:
+                self.check(f'{path}.initial', initial, (int, float),
+                           lambda initial: not valid or (
+                               bounds[0] <= initial <= bounds[1]))
+            for key, fallback, types, condition in Limits:
+                self.check(f'{path}.{key}', options.get(key, fallback),
+                           types, condition)
+        elif type == 'enum':
+            values = options.get('options')
+            valid = self.check(f'{path}.options', values, list, bool,
+                               'expected a non-empty list')
+            if initial is not None and valid:
+                self.check(f'{path}.initial', initial, object,
+                           lambda initial: initial in values)
+        elif type == 'boolean':
+            if initial is not None:
+                self.check(f'{path}.initial', initial, bool)
+        else:
+            self.error(f'{path}.type', f'invalid type {type!r}')
+
+        return State(name, type, initial)
+
+    def module(self, path, item):
+        if not isinstance(item, dict) or len(item) != 1:
+            self.error(path, 'expected a single mapping')
+            return None
+
+        type, options = next(iter(item.items()))
+        path = f'{path}.{type}'
+        try:
+            found = importlib.util.find_spec(f'modules.{type}') is not None
+        except (ImportError, ValueError):
+            found = False
+        interface = None
+        if not found:
+            self.error(path, f'unknown module {type!r}')
+        else:
+            # imported here anyway, it is cached for module creation
+            try:
+                interface = Config(type).oftype(Config.Key, 'modules', Base)
+            except Exception:
+                self.error(path, f'cannot import module {type!r}')
+
+        if isinstance(options, list):
+            # module configured by a list (e.g. ir keys)
+            for index, option in enumerate(options):
+                option = self.mapping(f'{path}[{index}]', option)
+                if interface is not None:
+                    self.options(
+                        f'{path}[{index}]', option, interface.Items)
+            return Module(type, options)
+
+        options = self.mapping(path, options)
+        if interface is not None:
+            self.options(path, options, interface.Options)
+        period = options.get('period')
+        if period is not None:
+            self.check(f'{path}.period', period, (int, float),
+                       lambda period: period > 0)
+        namespace = options.get('namespace')
+        if namespace is not None:
+            self.check(f'{path}.namespace', namespace, str,
+                       lambda namespace: '.' not in namespace)
+
+        return Module(type, options)
+
+    def settings(self, document):
+        """ Validate a complete document """
+
+        document = self.mapping('config', document)
+
+        backend = document.get('backend', 'pigpio')
+        self.check('backend', backend, str, Backends.__contains__)
+        enabled = document.get('metrics', False)
+        self.check('metrics', enabled, bool)
+
+        options = self.mapping('logging', document.get('logging'))
+        level = options.get('level', 'INFO')
+        self.check('logging.level', level, str, Levels.__contains__)
+        size = options.get('journal', 256)
+        self.check('logging.journal', size, int, lambda size: size >= 0)
+
+        options = self.mapping('queue', document.get('queue'))
+        capacity = options.get('capacity', 64)
+        self.check('queue.capacity', capacity, int, lambda size: size >= 1)
+        policy = options.get('policy', 'drop-oldest')
+        self.check('queue.policy', policy, str, Policies.__contains__)
+
+        commands = []
+        items = document.get('commands') or []
+        if self.check('commands', items, list):
+            for index, item in enumerate(items):
+                command = self.command(f'commands[{index}]', item)
+                if command is None:
+                    continue
+                if any(known.name == command.name for known in commands):
+                    self.error(f'commands[{index}]',
+                               f'duplicate command {command.name!r}')
+                commands.append(command)
+
+        states = []
+        if 'states' not in document:
+            self.error('states', 'required')
+        for name, options in self.mapping(
+                'states', document.get('states')).items():
+            states.append(self.state(f'states.{name}', name, options))
+
+        modules = []
+        items = document.get('modules')
+        if items is None:
+            self.error('modules', 'required')
+        elif self.check('modules', items, list):
+            for index, item in enumerate(items):
+                module = self.module(f'modules[{index}]', item)
+                if module is not None:
+                    modules.append(module)
+
+        return Settings(
+            backend, enabled, level, size, capacity, policy,
+            tuple(commands), tuple(states), tuple(modules), document)
+
+
+def validate(document):
+    """ Validate a parsed document and report all errors at once """
+
+    validator = Validator()
+    settings = validator.settings(document)
+    if validator.errors:
+        raise Exception(
+            'Invalid config:\n' + '\n'.join(
+                f'  {error}' for error in validator.errors))
+    return settings
+
+
+def load(filename):
+    """
+    Load and validate a YAML config
+
+    The validated settings are cached next to the config file. The cache is
+    used as long as the modification time and size of the file match, or
+    otherwise its content hash, so the YAML is only parsed after changes.
+    """
+
+    stat = os.stat(filename)
+    directory, name = os.path.split(filename)
+    cache = os.path.join(directory, f'.{name}.cache')
+
+    cached = None
+    try:
+        with open(cache, 'rb') as file:
+            cached = pickle.load(file)
+    except Exception:
+        pass
+
+    if cached is not None and cached[0] != Version:
+        cached = None
+    if cached is not None and cached[1:3] == (stat.st_mtime_ns, stat.st_size):
+        logging.debug('using cached config %s', cache)
+        return cached[4]
+
+    with open(filename, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    if cached is not None and cached[3] == digest:
+        settings = cached[4]
+    else:
+        settings = validate(yaml.safe_load(content))
+
+    try:
+        with open(cache, 'wb') as file:
+            pickle.dump((
+                Version, stat.st_mtime_ns, stat.st_size, digest, settings
+            ), file)
+    except OSError:
+        logging.debug('cannot write config cache %s', cache)
+
+    return settings
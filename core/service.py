@@ -1,7 +1,10 @@
 from .module import ConsumingModule, PollingModule
+from .metrics import metrics
 
+import itertools
 import logging
 import threading
+import heapq
 import time
 
 
@@ -68,6 +71,99 @@ class Worker:
         # thread.join()
 
 
+class Scheduler:
+    """
+    Schedules polling modules
+
+    Every module is polled according to its own period. The modules are kept
+    in a heap ordered by their next due time, so the polling thread sleeps
+    until the next module is due or until a module requests to be woken up.
+    """
+
+    def __init__(self):
+        self._modules = []
+        self._heap = []
+        self._ready = []
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._sequence = itertools.count()
+
+    def add(self, module):
+        """ Add a polling module """
+
+        module._scheduler = self
+        self._modules.append(module)
+
+    def wake(self, module):
+        """ Poll the given module as soon as possible """
+
+        with self._lock:
+            self._ready.append(module)
+        self._event.set()
+
+    def interrupt(self):
+        """ Wake up the polling thread (e.g. to stop it) """
+
+        self._event.set()
+
+    def reset(self):
+        """ Schedule all periodic modules to be due immediately """
+
+        now = time.monotonic()
+        self._heap = [
+            (now, next(self._sequence), module)
+            for module in self._modules
+            if module.period is not None
+        ]
+        heapq.heapify(self._heap)
+
+    def _poll(self, module):
+        """ Poll a single module """
+
+        if not metrics.enabled:
+            module.poll()
+            return
+
+        start = time.perf_counter()
+        module.poll()
+        metrics.histogram(
+            'raspeaker_poll_duration_seconds',
+            'Duration of poll() per module',
+            module=type(module).__name__).observe(time.perf_counter() - start)
+
+    def run(self, running):
+        """ Poll due modules as long as running() is true """
+
+        self.reset()
+        while running():
+            self._event.clear()
+
+            # modules that explicitly requested a poll
+            with self._lock:
+                ready, self._ready = self._ready, []
+            for module in ready:
+                self._poll(module)
+
+            # modules that are due
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, module = self._heap[0]
+                self._poll(module)
+
+                # skip missed periods instead of catching up
+                due += module.period
+                if due < now:
+                    due = now + module.period
+                heapq.heapreplace(
+                    self._heap, (due, next(self._sequence), module))
+
+            # sleep until the next module is due
+            timeout = None
+            if self._heap:
+                timeout = max(0, self._heap[0][0] - time.monotonic())
+            self._event.wait(timeout)
+
+
 class Service:
     """ Schedules the components """
 
@@ -75,69 +171,111 @@ class Service:
         self._state = state
         self._queue = queue
 
-        self._consumer = None
+        self._consumers = {}
         self._components = []
-        self._pollers = []
+        self._power = [
+            element for element in state.properties
+            if element.name == 'power' or element.name.endswith('.power')
+        ]
+        self._scheduler = Scheduler()
         self._running = True
 
         self._poll_worker = Worker(self._poll_loop, 'poll thread')
-        self._queue_worker = Worker(self._queue_loop, 'queue thread')
+        self._queue_workers = []
         self._update_worker = Worker(self._update_loop, 'update thread')
 
     def _poll_loop(self, cycle, worker):
         """ Polling components loop """
 
-        while cycle == worker.cycle:
+        self._scheduler.run(lambda: cycle == worker.cycle)
 
-            for component in self._pollers:
-                component.poll()
-            time.sleep(0.05)
+    def _queue_loop(self, consumer):
+        """ Consuming component loop (one per partition) """
 
-    def _queue_loop(self, cycle, worker):
-        """ Consuming component loop """
+        def loop(cycle, worker):
+            partition = consumer.partition
+            while self._running:
 
-        if self._consumer is None:
-            logging.error('missing consumer')
-            return
+                partition.clear()
+                consumer.consume()
+                partition.wait()
 
-        while self._running:
+        return loop
+
+    def _powered(self):
+        """ Checks whether any of the devices is turned on """
 
-            self._queue.clear()
-            self._consumer.consume()
-            self._queue.wait()
+        # devices without power property are always on
+        if not self._power:
+            return True
+        return any(element.value for element in self._power)
 
     def _update_loop(self, cycle, worker):
         """ Main application loop """
 
+        version = 0
         while self._running:
-            self._state.clear()
+            version, changes = self._state.changes(version)
 
             # start polling loop if neccessary
-            if self._state.get('power') and not self._poll_worker.running:
+            if self._powered() and not self._poll_worker.running:
                 logging.info('device turned on')
                 self._poll_worker.start()
 
-            # run updates on components
-            for component in self._components:
-                component.update()
+            # run updates on interested components only
+            if changes:
+                for component in self._components:
+                    subscriptions = component.subscriptions
+                    if subscriptions is None:
+                        self._update(component, changes)
+                    elif not subscriptions.isdisjoint(changes):
+                        self._update(component, changes & subscriptions)
 
             # stop polling loop if neccessary
-            if not self._state.get('power') and self._poll_worker.running:
+            if not self._powered() and self._poll_worker.running:
                 logging.info('device turned off')
                 self._poll_worker.stop()
+                self._scheduler.interrupt()
 
-            self._state.wait()
+            self._state.wait_for(version)
+
+    def _update(self, component, changes):
+        """ Update a single component """
+
+        if not metrics.enabled:
+            component.update(changes)
+            return
+
+        start = time.perf_counter()
+        component.update(changes)
+        metrics.histogram(
+            'raspeaker_update_duration_seconds',
+            'Duration of update() per module',
+            module=type(component).__name__).observe(
+                time.perf_counter() - start)
 
     def register(self, component):
         if isinstance(component, ConsumingModule):
-            self._consumer = component
+            if component.namespace in self._consumers:
+                raise Exception(
+                    f'Multiple consumers for namespace "{component.namespace}"')
+            self._consumers[component.namespace] = component
         if isinstance(component, PollingModule):
-            self._pollers.append(component)
+            self._scheduler.add(component)
         self._components.append(component)
 
         # initialize component state
         component.update()
 
     def start(self):
-        self._queue_worker.start()
+        if not self._consumers:
+            logging.error('missing consumer')
+
+        for namespace, consumer in self._consumers.items():
+            description = 'queue thread'
+            if namespace is not None:
+                description = f'queue thread ({namespace})'
+            worker = Worker(self._queue_loop(consumer), description)
+            self._queue_workers.append(worker)
+            worker.start()
         self._update_worker.start()
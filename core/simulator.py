@@ -0,0 +1,305 @@
+""" Contains an in-process replacement for the pigpio interface """
+import threading
+import logging
+import pigpio
+import struct
+import os
+
+
+class Simulator:
+    """
+    Simulates the subset of pigpio.pi used by the modules
+
+    The simulator is deterministic: time is a virtual tick counter (in
+    microseconds) that only advances when told so, and all callbacks are
+    invoked synchronously by the thread injecting an event. Outgoing traffic
+    (pin levels, I2C writes, waves) is recorded, so it can be inspected by
+    benchmarks and tests. Constants (modes, edges, pulses) are still taken
+    from the pigpio module, which does not require a daemon.
+    """
+
+    class Callback:
+        """ Mimics the callback handle returned by pigpio """
+
+        def __init__(self, simulator, registry, key, func, edge=None):
+            self._simulator = simulator
+            self._registry = registry
+            self._key = key
+            self._func = func
+            self._edge = edge
+            self._tally = 0
+
+        def _fire(self, *args):
+            self._tally += 1
+            self._func(*args)
+
+        def tally(self):
+            return self._tally
+
+        def reset_tally(self):
+            self._tally = 0
+
+        def cancel(self):
+            with self._simulator._lock:
+                callbacks = self._registry.get(self._key, [])
+                if self in callbacks:
+                    callbacks.remove(self)
+
+    def __init__(self):
+        self.connected = True
+
+        self._lock = threading.RLock()
+        self._tick = 0
+        self._levels = {}
+        self._modes = {}
+        self._callbacks = {}
+        self._events = {}
+        self._notifications = {}
+
+        # I2C master
+        self._handles = {}
+        self._i2c_writes = []
+        self._i2c_failures = 0
+        self._i2c_registers = {}
+
+        # I2C slave
+        self._bsc = bytearray()
+
+        # waves
+        self._pulses = []
+        self._waves = {}
+        self._wave = None
+
+    @property
+    def tick(self):
+        return self._tick
+
+    @property
+    def i2c_writes(self):
+        """ Gets all I2C writes as (tick, handle, data) """
+        return self._i2c_writes
+
+    @property
+    def waves(self):
+        """ Gets the pulses of all created waves by id """
+        return self._waves
+
+    @property
+    def wave(self):
+        """ Gets the id of the wave being transmitted """
+        return self._wave
+
+    def fail_i2c(self, count=1):
+        """ Let the next I2C writes fail """
+        self._i2c_failures = count
+
+    def i2c_respond(self, handle, register, data):
+        """ Set the bytes returned when reading a register of a device """
+        with self._lock:
+            self._i2c_registers[(handle, register)] = bytearray(data)
+
+    def advance(self, micros):
+        """ Advance the virtual clock """
+        with self._lock:
+            self._tick = (self._tick + int(micros)) & 0xffffffff
+            return self._tick
+
+    def inject(self, gpio, level, tick=None):
+        """ Change the level of an input pin (at the given tick) """
+        with self._lock:
+            if tick is not None:
+                self._tick = tick & 0xffffffff
+            self._set_level(gpio, level)
+
+    def inject_bsc(self, data):
+        """ Receive bytes as I2C slave and fire the BSC event """
+        with self._lock:
+            self._bsc += bytes(data)
+            self.event_trigger(pigpio.EVENT_BSC)
+
+    def _set_level(self, gpio, level):
+        level = int(bool(level))
+        previous = self._levels.get(gpio, 0)
+        self._levels[gpio] = level
+        if previous == level:
+            return
+
+        for notification in self._notifications.values():
+            if notification['bits'] & (1 << gpio):
+                self._notify(notification)
+
+        edge = pigpio.RISING_EDGE if level else pigpio.FALLING_EDGE
+        for callback in list(self._callbacks.get(gpio, [])):
+            if callback._edge in (edge, pigpio.EITHER_EDGE):
+                callback._fire(gpio, level, self._tick)
+
+    def _notify(self, notification):
+        """ Write a report to a notification pipe """
+        notification['sequence'] = (notification['sequence'] + 1) & 0xffff
+        os.write(notification['write'], struct.pack(
+            'HHII', notification['sequence'], 0, self._tick,
+            self.read_bank_1()))
+
+    def notify_pipe(self, handle):
+        """ Gets the file descriptor to read notifications (simulator only) """
+        return self._notifications[handle]['read']
+
+    def stop(self):
+        self.connected = False
+
+    def get_current_tick(self):
+        return self._tick
+
+    def set_mode(self, gpio, mode):
+        self._modes[gpio] = mode
+        return 0
+
+    def get_mode(self, gpio):
+        return self._modes.get(gpio, pigpio.INPUT)
+
+    def set_pull_up_down(self, gpio, pud):
+        return 0
+
+    def set_glitch_filter(self, gpio, steady):
+        return 0
+
+    def set_noise_filter(self, gpio, steady, active):
+        return 0
+
+    def read(self, gpio):
+        return self._levels.get(gpio, 0)
+
+    def read_bank_1(self):
+        return sum(
+            level << gpio for gpio, level in self._levels.items() if gpio < 32)
+
+    def write(self, gpio, level):
+        with self._lock:
+            self._set_level(gpio, level)
+        return 0
+
+    def callback(self, gpio, edge=pigpio.RISING_EDGE, func=None):
+        with self._lock:
+            callback = Simulator.Callback(
+                self, self._callbacks, gpio, func, edge)
+            self._callbacks.setdefault(gpio, []).append(callback)
+            return callback
+
+    def event_callback(self, event, func=None):
+        with self._lock:
+            callback = Simulator.Callback(self, self._events, event, func)
+            self._events.setdefault(event, []).append(callback)
+            return callback
+
+    def event_trigger(self, event):
+        with self._lock:
+            for callback in list(self._events.get(event, [])):
+                callback._fire(event, self._tick)
+        return 0
+
+    def notify_open(self):
+        with self._lock:
+            read, write = os.pipe()
+            handle = len(self._notifications)
+            self._notifications[handle] = {
+                'bits': 0, 'sequence': 0, 'read': read, 'write': write}
+            return handle
+
+    def notify_begin(self, handle, bits):
+        with self._lock:
+            self._notifications[handle]['bits'] = bits
+        return 0
+
+    def notify_close(self, handle):
+        with self._lock:
+            notification = self._notifications.pop(handle)
+            os.close(notification['write'])
+        return 0
+
+    def bsc_i2c(self, i2c_address, data=[]):
+        with self._lock:
+            received, self._bsc = bytes(self._bsc), bytearray()
+            return 0, len(received), received
+
+    def i2c_open(self, i2c_bus, i2c_address, i2c_flags=0):
+        with self._lock:
+            handle = len(self._handles)
+            self._handles[handle] = (i2c_bus, i2c_address)
+            return handle
+
+    def i2c_close(self, handle):
+        self._handles.pop(handle, None)
+        return 0
+
+    def i2c_write_device(self, handle, data):
+        with self._lock:
+            if self._i2c_failures > 0:
+                self._i2c_failures -= 1
+                raise pigpio.error('simulated I2C failure')
+            self._i2c_writes.append((self._tick, handle, bytes(data)))
+        return 0
+
+    def i2c_read_i2c_block_data(self, handle, reg, count):
+        with self._lock:
+            data = self._i2c_registers.get((handle, reg), bytearray(count))
+            return count, data[:count]
+
+    def wave_clear(self):
+        with self._lock:
+            self._pulses = []
+            self._waves.clear()
+        return 0
+
+    def wave_add_generic(self, pulses):
+        with self._lock:
+            self._pulses.extend(pulses)
+            return len(self._pulses)
+
+    def _create_wave(self):
+        """ Store the added pulses as wave (using the lowest free id) """
+        wave = 0
+        while wave in self._waves:
+            wave += 1
+        self._waves[wave], self._pulses = self._pulses, []
+        return wave
+
+    def wave_create(self):
+        with self._lock:
+            return self._create_wave()
+
+    def wave_create_and_pad(self, percent):
+        with self._lock:
+            if (len(self._waves) + 1) * percent > 100:
+                raise pigpio.error('no more CBs for waveform')
+            return self._create_wave()
+
+    def wave_delete(self, wave_id):
+        with self._lock:
+            if self._waves.pop(wave_id, None) is None:
+                raise pigpio.error('unknown wave id')
+        return 0
+
+    def wave_send_repeat(self, wave_id):
+        with self._lock:
+            pulses = self._waves[wave_id]
+            self._wave = wave_id
+            return sum(pulse.delay for pulse in pulses)
+
+    def wave_tx_stop(self):
+        self._wave = None
+        return 0
+
+    def wave_tx_busy(self):
+        return int(self._wave is not None)
+
+
+def connect(config):
+    """ Connect to the GPIO backend selected by the "backend" option """
+
+    backend = config.optional('backend', 'pigpio').value
+    if backend == 'simulator':
+        logging.info('using simulated GPIO')
+        return Simulator()
+    if backend == 'pigpio':
+        return pigpio.pi()
+    raise Exception(f'Invalid value "{backend}" for "backend"')
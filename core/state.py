@@ -1,5 +1,6 @@
 from .types import boolean, enum, number
 
+import contextlib
 import threading
 import logging
 
@@ -12,11 +13,26 @@ class State:
     Every element has predefiend commands, that can be used to adjust the elements value.
     The commands can be overriden by the main component in order to inject additional logic,
     that is required to apply the change to the physical device.
+
+    Every change increments the state version. Consumers remember the last
+    version they have seen and wait for a newer one, so no change is missed or
+    processed twice. The state also remembers the version each property was
+    last changed at, so updates can be dispatched to interested modules only.
+
+    Multiple updates can be grouped in a transaction. Its changes are staged
+    in a journal of the executing thread (without holding the lock, so other
+    consumers and readers are not blocked by device I/O) and applied at once
+    when it completes. Readers either see all or none of its changes, and
+    the changes are discarded if it fails. The executing thread sees its own
+    staged changes.
     """
 
     def __init__(self, config, queue):
         self._state = {}
-        self._event = threading.Event()
+        self._version = 0
+        self._modified = {}
+        self._condition = threading.Condition()
+        self._local = threading.local()
 
         for item in config.items():
 
@@ -27,6 +43,7 @@ class State:
                 "boolean": boolean.Boolean,
             })(item)
             self._state[element.name] = element
+            element.attach(self)
 
             # auto-generate commands for the element
             element.register_commands(queue)
@@ -35,21 +52,108 @@ class State:
     def properties(self):
         return self._state.values()
 
+    @property
+    def version(self):
+        return self._version
+
     def _update(self, property, value):
         if property not in self._state:
             raise Exception(f'Unknown state {property}')
+
         return self._state[property].force(value)
 
+    def _current(self, element):
+        """ Gets the value of an element as seen by the current thread """
+
+        journal = getattr(self._local, 'journal', None)
+        if journal is not None and element.name in journal:
+            return journal[element.name]
+        with self._condition:
+            return element.value
+
+    def _write(self, element, value):
+        """ Stage a change within a transaction or apply it right away """
+
+        journal = getattr(self._local, 'journal', None)
+        if journal is not None:
+            journal[element.name] = value
+            return
+
+        with self._condition:
+            self._apply(element, value)
+            self._condition.notify_all()
+
+    def _apply(self, element, value):
+        """ Apply and track a change (lock must be held) """
+
+        element._apply(value)
+        self._version += 1
+        self._modified[element.name] = self._version
+
     def get(self, property):
         if property not in self._state:
             raise Exception(f'Unknown state {property}')
-        return self._state[property].value
+        return self._current(self._state[property])
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """ Apply all updates within the context atomically """
+
+        if getattr(self._local, 'journal', None) is not None:
+            # nested transactions are part of the outer one
+            yield
+            return
+
+        journal = self._local.journal = {}
+        try:
+            yield
+        finally:
+            self._local.journal = None
+
+        with self._condition:
+            for property, value in journal.items():
+                element = self._state[property]
+                if element.value != value:
+                    self._apply(element, value)
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """ Gets the current version and a consistent copy of all values """
+        with self._condition:
+            return self._version, {
+                name: element.value
+                for name, element in self._state.items()
+            }
+
+    def changes(self, since):
+        """ Gets the current version and all properties changed after since """
+        with self._condition:
+            return self._version, {
+                name
+                for name, version in self._modified.items()
+                if version > since
+            }
+
+    def delta(self, since):
+        """ Gets the current version and all values changed after since """
+        with self._condition:
+            return self._version, {
+                name: self._state[name].value
+                for name, version in self._modified.items()
+                if version > since
+            }
 
-    def clear(self):
-        self._event.clear()
+    def wait_for(self, version, timeout=None):
+        """
+        Waits until the state is newer than the given version
 
-    def wait(self):
-        self._event.wait()
+        Returns the current version, which is not newer than the given version
+        if the timeout expired.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout)
+            return self._version
 
     def _notify(self):
-        self._event.set()
+        with self._condition:
+            self._condition.notify_all()
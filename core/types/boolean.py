@@ -9,7 +9,7 @@ class Boolean(Element):
         })
 
     def _toggle(self):
-        return self._call('set', not self._value)
+        return self._call('set', not self.current)
 
     def __str__(self):
         return f'{self._name}: boolean'
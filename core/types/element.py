@@ -1,13 +1,19 @@
 from core.config import Config
+from core.journal import journal
 
 import logging
 
 
 class Element:
+    # commands that receive the time they were enqueued at
+    Timestamped = ()
+
     def __init__(self, config, default, templates):
         self._name = config.require(Config.Key).value
         self._value = config.optional('initial', default).value
         self._templates = templates
+        self._version = 0
+        self._store = None
 
         logging.info(f'registered state.{self._name}={self._value}')
 
@@ -19,6 +25,18 @@ class Element:
     def value(self):
         return self._value
 
+    @property
+    def current(self):
+        """ Gets the value including changes staged by the current thread """
+        if self._store is None:
+            return self._value
+        return self._store._current(self)
+
+    @property
+    def version(self):
+        """ Gets the number of changes applied to this element """
+        return self._version
+
     def _command(self, name):
         return f'{self._name}_{name}'
 
@@ -28,13 +46,22 @@ class Element:
     def _set(self, value):
         self.force(value)
 
+    def attach(self, store):
+        """ Let the store apply all changes (e.g. to stage transactions) """
+        self._store = store
+
     def register_commands(self, queue):
         """ 
         Register all predefined commands for this element 
+
+        Setters are coalescing, since only the latest pending value matters.
+        Commands listed in Timestamped receive the time they were enqueued at.
         """
 
         for name, handler in self._templates.items():
-            queue.register(self._command(name), handler)
+            queue.register(
+                self._command(name), handler, coalesce=name == 'set',
+                timestamped=name in self.Timestamped)
 
     def force(self, value):
         """ 
@@ -44,9 +71,18 @@ class Element:
         state might not be handled or recognized correctly.
         """
 
-        if self._value != value:
-            logging.debug(f'state.{self._name}={value}')
-            self._value = value
+        if self.current != value:
+            logging.debug('state.%s=%s', self._name, value)
+            journal.record('state', self._name, value)
+            if self._store is None:
+                self._apply(value)
+            else:
+                self._store._write(self, value)
             return True
 
         return False
+
+    def _apply(self, value):
+        """ Change the value (called by the store) """
+        self._value = value
+        self._version += 1
@@ -15,7 +15,7 @@ class Enum(Element):
         return super()._force(value)
 
     def _toggle(self):
-        next = (self._options.index(self._value) + 1) % len(self._options)
+        next = (self._options.index(self.current) + 1) % len(self._options)
         return self._call('set', self._options[next])
 
     def __str__(self):
@@ -1,23 +1,77 @@
 from .element import Element
 
+import time
+
 
 class Number(Element):
+    """
+    Numeric value within a range
+
+    The value is changed by "step" (default 1) per inc/dec command. With
+    "acceleration" set to a maximum factor, the step grows with the rate of
+    inc/dec commands: commands enqueued faster than "interval" seconds apart
+    multiply the step by interval / elapsed (up to the maximum factor), so a
+    fast spin of a rotary encoder results in few large changes. The rate is
+    measured when the commands are enqueued, so a backlog of slow commands
+    is not accelerated. The add command changes the value by an arbitrary
+    delta. Values are integers.
+    """
+
+    Interval = 0.1
+    Timestamped = ('inc', 'dec')
+
     def __init__(self, config):
         super().__init__(config, 0, {
             'set': self._set,
             'inc': self._inc,
             'dec': self._dec,
+            'add': self._add,
         })
 
         self._range = config.optional('range', [0, 100]).value
+        self._step = config.optional('step', 1).value
+        self._acceleration = config.optional('acceleration', 1).value
+        self._interval = config.optional('interval', Number.Interval).value
+        self._last = None
+        self._direction = 0
+
+        if not isinstance(self._step, int) or self._step <= 0:
+            raise Exception(f'Invalid step {self._step} for {self._name}')
+        if not isinstance(self._acceleration, int) or self._acceleration < 1:
+            raise Exception(
+                f'Invalid acceleration {self._acceleration} for {self._name}')
+
+    def _accelerated(self, direction, timestamp):
+        """ Gets the step for an inc/dec command in the given direction """
+
+        if self._acceleration == 1:
+            return self._step
+
+        # derived commands are not timestamped
+        now = time.monotonic() if timestamp is None else timestamp
+        last, self._last = self._last, now
+        if direction != self._direction or last is None:
+            # changing direction starts over
+            self._direction = direction
+            return self._step
+
+        elapsed = now - last
+        if elapsed * self._acceleration <= self._interval:
+            return self._step * self._acceleration
+        return self._step * max(1, round(self._interval / elapsed))
+
+    def _add(self, delta):
+        current = self.current
+        value = current + round(delta)
+        value = min(max(value, self._range[0]), self._range[1])
+        if value != current:
+            return self._call('set', value)
 
-    def _inc(self):
-        if self._value < self._range[1]:
-            return self._call('set', self._value + 1)
+    def _inc(self, timestamp=None):
+        return self._add(self._accelerated(1, timestamp))
 
-    def _dec(self):
-        if self._value > self._range[0]:
-            return self._call('set', self._value - 1)
+    def _dec(self, timestamp=None):
+        return self._add(-self._accelerated(-1, timestamp))
 
     def __str__(self):
         return f'{self._name}: number'
@@ -15,6 +15,7 @@ pip3 install \
   pigpio \
   evdev \
   flask \
+  uvicorn \
   adafruit-circuitpython-ads1x15
 
 # clone repository
@@ -2,40 +2,44 @@
 from core.state import State
 from core.queue import Queue
 from core.service import Service
-from core.config import Config
-from core.module import Module
+from core import schema
+from core import module
+from core.metrics import metrics
+from core.journal import journal
+from core import simulator
 
 import logging
-import pigpio
 import flask
 import os
 
 
-# initialize logging
-logging.basicConfig(level=logging.DEBUG)
-
-# load config
+# load and validate config (all errors are reported at once)
 yaml = os.environ.get('RASPEAKER_CONFIG', 'config.yaml')
-config = Config.load(yaml)
+settings = schema.load(yaml)
+config = settings.config
+metrics.enable(settings.metrics)
+
+# initialize logging (recent events are kept in memory)
+logging.basicConfig(level=settings.level)
+journal.resize(settings.journal)
 
 # initialize webserver
 app = flask.Flask(__name__)
 
-# load GPIO
-pi = pigpio.pi()
+# load GPIO (or simulator)
+pi = simulator.connect(config)
 if not pi.connected:
     logging.error("GPIO not available")
     exit(0)
 
 # initialize core
-queue = Queue(config.optional('commands', {}))
+queue = Queue(config.optional('commands', []), config.optional('queue', {}))
 state = State(config.require('states'), queue)
 
-# initialize components
+# initialize components (concurrently, since most block on their device)
 service = Service(state, queue)
-for module in config.require('modules').items():
-    type = module.single().oftype(Config.Key, 'modules', base=Module)
-    instance = type(pi, state, queue, app, module.single())
+configs = [item.config for item in settings.modules]
+for instance in module.create(pi, state, queue, app, configs):
     service.register(instance)
 
 # run application
@@ -1,12 +1,122 @@
 
 from core.module import ConsumingModule
+from core.metrics import metrics
+from core.journal import journal
 from core import pins
 
+import threading
 import logging
 import pigpio
 import time
 
 
+class Transmitter:
+    """
+    Writes registers of the main unit over I2C
+
+    The last value written to each register is cached, so only registers
+    whose value changed are transmitted. Writes staged within the debounce
+    window are merged and sent at once. Failed writes are retried. The
+    metrics are labelled by the namespace of the controller.
+    """
+
+    def __init__(self, pi, handle, window=0, retries=2, namespace=None):
+        self._pi = pi
+        self._handle = handle
+        self._window = window
+        self._retries = retries
+
+        self._lock = threading.Lock()
+        self._registers = {}
+        self._staged = {}
+        self._timer = None
+
+        self._sent = 0
+        self._suppressed = 0
+        self._retried = 0
+        self._failed = 0
+
+        for result in ('sent', 'suppressed', 'retried', 'failed'):
+            metrics.register(
+                'raspeaker_i2c_writes_total', 'counter',
+                lambda result=result: self.statistics[result],
+                'Number of I2C register writes by result',
+                namespace=namespace or 'default', result=result)
+
+    @property
+    def statistics(self):
+        """ Gets the number of sent, suppressed, retried and failed writes """
+        return {
+            'sent': self._sent,
+            'suppressed': self._suppressed,
+            'retried': self._retried,
+            'failed': self._failed,
+        }
+
+    def write(self, register, value):
+        """ Stage a register write """
+
+        with self._lock:
+            self._staged[register] = value
+
+    def invalidate(self):
+        """ Forget all cached and staged values (e.g. after power loss) """
+
+        with self._lock:
+            self._registers.clear()
+            self._staged.clear()
+
+    def flush(self):
+        """ Transmit staged writes (after the debounce window) """
+
+        if not self._window:
+            self._transmit()
+            return
+
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self._window, self._transmit)
+            self._timer.start()
+
+    def _send(self, register, value):
+        """ Send a single register, returns whether it succeeded """
+
+        for attempt in range(self._retries + 1):
+            try:
+                logging.debug('sending %02x %02x', register, value)
+                self._pi.i2c_write_device(self._handle, [register, value])
+                journal.record('AltecLansing', 'send', register, value)
+                return True
+            except Exception as e:
+                error = e
+                if attempt < self._retries:
+                    self._retried += 1
+                    time.sleep(0.005 * (attempt + 1))
+
+        logging.error(f'failed to send {bytes([register, value])}: {error}')
+        return False
+
+    def _transmit(self):
+        """ Transmit all staged writes that change a register """
+
+        with self._lock:
+            staged, self._staged = self._staged, {}
+            self._timer = None
+
+            for register, value in staged.items():
+                if self._registers.get(register) == value:
+                    self._suppressed += 1
+                    continue
+
+                if self._send(register, value):
+                    self._registers[register] = value
+                    self._sent += 1
+                else:
+                    self._registers.pop(register, None)
+                    self._failed += 1
+
+
 class Controller(ConsumingModule):
     """ Injects I2C communication between the AltecLansing main unit and satellite """
 
@@ -19,6 +129,12 @@ class Controller(ConsumingModule):
     MIN_VOL = 111
     MAX_VOL = 26
 
+    Options = (
+        ('i2c', True, int, lambda bus: bus >= 0),
+        ('debounce', False, (int, float), lambda debounce: debounce >= 0),
+        ('retries', False, int, lambda retries: retries >= 0),
+    )
+
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
         self._register_commands(
@@ -29,6 +145,8 @@ class Controller(ConsumingModule):
         )
 
         self._bus = config.require('i2c').value
+        self._debounce = config.optional('debounce', 0).value
+        self._retries = config.optional('retries', 2).value
 
         # register as I2C slave
         self._event = pi.event_callback(pigpio.EVENT_BSC, self._receive)
@@ -80,44 +198,47 @@ class Controller(ConsumingModule):
         # register as I2C master
         logging.info(f'connecting over i2c{self._bus}')
         self._i2c = self._pi.i2c_open(self._bus, Controller.I2C_ADDRESS)
+        self._transmitter = Transmitter(
+            self._pi, self._i2c, self._debounce, self._retries,
+            self._namespace)
 
     def _send_command(self, command, value):
-        """ Send a single command over I2C """
-        try:
-            logging.debug(f'sending {bytes([command, value])}')
-            self._pi.i2c_write_device(self._i2c, [command, value])
-        except Exception as e:
-            logging.exception('failed to send')
+        """ Stage a single command to be sent over I2C """
+        self._transmitter.write(command, value)
 
     def _send_state(self):
         """ Transmit the current state to the main unit """
-        volume = Controller.MIN_VOL - self._state.get('volume')
-        treble = self._state.get('treble')
-        bass = self._state.get('bass')
+        volume = Controller.MIN_VOL - self._value('volume')
+        treble = self._value('treble')
+        bass = self._value('bass')
         balance = self.to_packed_4bit(bass, treble)
 
-        if self._state.get('power'):
+        if self._value('power'):
             self._send_command(Controller.CMD_VOLUME, volume)
             self._send_command(Controller.CMD_BALANCE, balance)
             self._send_command(0xE4, 0x00)
             self._send_command(0xE6, 0x00)
             self._send_command(Controller.CMD_POWER, 0x01)
+            self._transmitter.flush()
+        else:
+            # main unit does not keep its registers when powered off
+            self._transmitter.invalidate()
 
     def _cmd_power_set(self, power):
         if self._update_state('power', power):
-            self._send_state()
+            self._defer(self._send_state)
 
     def _cmd_volume_set(self, volume):
         if self._update_state('volume', volume):
-            self._send_state()
+            self._defer(self._send_state)
 
     def _cmd_treble_set(self, treble):
         if self._update_state('treble', treble):
-            self._send_state()
+            self._defer(self._send_state)
 
     def _cmd_bass_set(self, bass):
         if self._update_state('bass', bass):
-            self._send_state()
+            self._defer(self._send_state)
 
     def _handle_power(self, value):
         self.command('power_set', value)
@@ -127,8 +248,10 @@ class Controller(ConsumingModule):
 
     def _handle_balance(self, value):
         bass, treble = self.from_packed_4bit(value)
-        self.command('treble_set', treble)
-        self.command('bass_set', bass)
+        self._queue.transact([
+            (self._name('treble_set'), (treble,), {}),
+            (self._name('bass_set'), (bass,), {}),
+        ])
 
     def _pass(self, value):
         pass
@@ -137,7 +260,8 @@ class Controller(ConsumingModule):
         """ Receive command from satellite """
 
         _, count, data = self._pi.bsc_i2c(Controller.I2C_ADDRESS)
-        logging.debug(f'received {count} bytes: {data}')
+        logging.debug('received %s bytes: %s', count, data)
+        journal.record('AltecLansing', 'receive', data)
 
         # parse command and forward to handler to update state
         for i in range(0, count, 2):
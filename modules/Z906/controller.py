@@ -1,7 +1,9 @@
 from core.component import ConsumingComponent
 from core.types import Input, Speakers, Effect, Stage, Commands
 from core.service import Worker
+from core.journal import journal
 from core import pins
+from modules.Z906.parser import Parser
 
 import logging
 import serial
@@ -51,67 +53,57 @@ class Reader(Worker):
         self._delegate = delegate
         self._serial = serial
 
+        # frames indexed by their first byte (payload length, handler)
+        frames = {
+            0x11: (6, self._on),
+            0x37: (0, self._off),
+            0x18: (0, None),
+        }
+        for command in Mappings.VolumeUp.values():
+            frames[command[0]] = (0, self._volume_up)
+        for command in Mappings.VolumeDown.values():
+            frames[command[0]] = (0, self._volume_down)
+        for command in Mappings.Inputs.values():
+            frames[command[0]] = (0, self._input_selected)
+
+        self._parser = Parser(frames, {
+            0x0a: self._state,
+        })
+
+        # reverse lookups
+        self._volume_up_speakers = {
+            command: speakers
+            for speakers, command in Mappings.VolumeUp.items()}
+        self._volume_down_speakers = {
+            command: speakers
+            for speakers, command in Mappings.VolumeDown.items()}
+        self._inputs = {
+            command: input
+            for input, command in Mappings.Inputs.items()}
+
     def _log(self, *params):
         """ Logs the given message """
 
-        data = b'|'.join(params)
-        logging.debug(f'<< {data}')
+        journal.record('Z906', params[0].decode(), *params[1:])
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('<< %s', b'|'.join(params))
 
     def _read(self, cycle, worker):
         """ Receives incoming serial commands """
 
         while cycle == worker.cycle:
 
-            data = self._serial.read()
-            if not data:
-                continue
-
-            elif data == b'\xaa':
-                self._message()
-            elif data == b'\x11':
-                self._on()
-            elif data == b'\x37':
-                self._off()
-            elif data in Mappings.VolumeUp.values():
-                self._volume_up(data)
-            elif data in Mappings.VolumeDown.values():
-                self._volume_down(data)
-            elif data in Mappings.Inputs.values():
-                self._input_selected(data)
-            elif data == b'\x18':
-                pass
-            else:
-                logging.warning(f'unknown byte {data}')
-
-    def _message(self):
-        """ Read a well-formed message """
-
-        marker = self._serial.read()
-        if not marker:
-            return
-
-        length = self._serial.read()
-        if not length:
-            return
-
-        length = int(length[0])
-        content = self._serial.read(length)
-        if len(content) < length:
-            return
-
-        # message parsed successfully
-        if marker == b'\x0a':
-            self._state(content)
-        else:
-            logging.warning(f'unknown marker: {marker}')
-
-    def _on(self):
-        data = self._serial.read(6)
-
-        self._log(b'on', data)
+            # block for the first byte, then read everything available
+            data = self._serial.read(max(1, self._serial.in_waiting))
+            if data:
+                self._parser.feed(data)
+
+    def _on(self, data):
+
+        self._log(b'on', data[1:])
         self._delegate._notify_on()
 
-    def _off(self):
+    def _off(self, data):
 
         self._log(b'off')
         self._delegate._notify_off()
@@ -119,26 +111,17 @@ class Reader(Worker):
     def _volume_up(self, data):
 
         self._log(b'volume up', data)
-        for speakers, command in Mappings.VolumeUp.items():
-            if command == data:
-                self._delegate._notify_volume_up(speakers)
-                return
+        self._delegate._notify_volume_up(self._volume_up_speakers[data])
 
     def _volume_down(self, data):
 
         self._log(b'volume down', data)
-        for speakers, command in Mappings.VolumeDown.items():
-            if command == data:
-                self._delegate._notify_volume_down(speakers)
-                return
+        self._delegate._notify_volume_down(self._volume_down_speakers[data])
 
     def _input_selected(self, data):
 
         self._log(b'input selected', data)
-        for input, command in Mappings.Inputs.items():
-            if command == data:
-                self._delegate._notify_input_selected(input)
-                return
+        self._delegate._notify_input_selected(self._inputs[data])
 
     def _state(self, content):
 
@@ -167,11 +150,7 @@ class Writer:
     @staticmethod
     def checksum(data):
         """ Calculate a checksum over given bytes """
-
-        checksum = 0
-        for byte in data:
-            checksum = (checksum + byte) % 255
-        return checksum
+        return Parser.checksum(data)
 
     @staticmethod
     def message(marker, content):
@@ -235,7 +214,8 @@ class Writer:
 
         # build command and log it
         data = command(**kwargs)
-        logging.debug(f">> {data}")
+        logging.debug('>> %s', data)
+        journal.record('Z906', 'write', data)
 
         # send command to device
         self._serial.write(data)
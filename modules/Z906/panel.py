@@ -2,12 +2,28 @@ from core.component import Component
 from core.types import Input, Effect, Speakers, Stage
 from core import pins
 
+import collections
 import pigpio
 import copy
 
 
 class Panel(Component):
-    """ Controls the front panel """
+    """
+    Controls the front panel
+
+    The LED matrix is multiplexed using a pigpio wave. Every distinct frame
+    (row masks and dimming) is described by a compact key. The waves of
+    recently shown frames are cached, so switching to a known frame does not
+    create a new wave and an unchanged frame does not touch pigpio at all.
+
+    All waves are padded to the same share of pigpio's resources, since
+    pigpio only reuses the resources of a deleted wave for a wave of the
+    same size. This way evicting any cached wave makes room for a new one.
+    """
+
+    # number of cached waves (all of them fit into pigpio's resources)
+    CacheSize = 32
+    Padding = 100 // CacheSize
 
     Leds = {
         pins.Q9: {
@@ -73,15 +89,17 @@ class Panel(Component):
     def __init__(self, pi, state, queue):
         super().__init__(pi, state, queue)
 
-        # references to the waves
+        # references to the waves (by frame)
+        self._waves = collections.OrderedDict()
         self._wave = None
-        self._old = None
+        self._frame = None
 
         # prepare power LED
         pi.set_mode(pins.Q4, pigpio.OUTPUT)
 
         # reset any previous states
         pi.wave_tx_stop()
+        pi.wave_clear()
         pi.write(pins.Q4, 0)
 
         # prepare all cols (+)
@@ -134,46 +152,73 @@ class Panel(Component):
 
         return (mask, dim, factor)
 
-    def create_wave(self, state):
-        """ Create wave for LED multiplexing """
+    def frame(self, state):
+        """ Generate the frame key (on mask, dim mask, on time) per row """
 
-        pulses = []
+        frame = []
         for row in Panel.Rows:
             (turn_on, dim_off, factor) = self.row_mask(row, state)
+            on_time = 1500 if factor is None else int(1500 * factor)
+            frame.append((turn_on, dim_off, on_time))
+        return tuple(frame)
+
+    def create_wave(self, frame):
+        """ Create wave for LED multiplexing """
+
+        pulses = []
+        for (turn_on, dim_off, on_time) in frame:
             turn_off = ~turn_on & (self.all_rows_mask | self.all_cols_mask)
 
-            if factor is None:
+            if on_time == 1500:
                 # no dimmed LEDs
                 pulses.append(pigpio.pulse(turn_on, turn_off, 1500))
             else:
                 # single dimmed LED
                 pulses.extend([
-                    pigpio.pulse(turn_on, turn_off, int(1500 * factor)),
-                    pigpio.pulse(0, dim_off, int(1500 * (1.0 - factor)))
+                    pigpio.pulse(turn_on, turn_off, on_time),
+                    pigpio.pulse(0, dim_off, 1500 - on_time)
                 ])
 
         self._pi.wave_add_generic(pulses)
-        return self._pi.wave_create()
+        return self._pi.wave_create_and_pad(Panel.Padding)
 
-    def update(self):
-        """ Update the panel to display given state """
+    def _lookup_wave(self, frame):
+        """ Get cached wave for the frame or create a new one """
+
+        wave = self._waves.get(frame)
+        if wave is not None:
+            self._waves.move_to_end(frame)
+            return wave
+
+        # evict least recently used wave (never the one being transmitted)
+        if len(self._waves) >= Panel.CacheSize:
+            for cached in self._waves:
+                if self._waves[cached] != self._wave:
+                    self._pi.wave_delete(self._waves.pop(cached))
+                    break
 
-        if self._old:
-            # delete wave from last update cycle
-            self._pi.wave_delete(self._old)
-            self._old = None
+        wave = self.create_wave(frame)
+        self._waves[frame] = wave
+        return wave
+
+    def update(self, changes=None):
+        """ Update the panel to display given state """
 
         # show power state
         self._pi.write(pins.Q4, self._state.powered)
 
         # update wave
         if self._state.ready:
-            self._old = self._wave
-            self._wave = self.create_wave(self._state)
+            frame = self.frame(self._state)
+            if frame == self._frame:
+                return
+
+            self._wave = self._lookup_wave(frame)
+            self._frame = frame
             self._pi.wave_send_repeat(self._wave)
 
         # power down
-        elif self._wave:
+        elif self._wave is not None:
             self._write_all_low()
-            self._old = self._wave
             self._wave = None
+            self._frame = None
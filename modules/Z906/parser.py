@@ -0,0 +1,87 @@
+""" Contains the decoder of the Z906 serial protocol """
+import logging
+
+
+class Parser:
+    """
+    Incrementally decodes frames from a byte stream
+
+    Received bytes are appended to a buffer, from which all complete frames
+    are decoded. Single-byte frames (with an optional fixed-length payload)
+    are dispatched using a table indexed by their first byte. Well-formed
+    messages (0xAA, marker, length, content, checksum) are validated and
+    dispatched by their marker. Incomplete frames remain in the buffer. On
+    an invalid checksum, everything up to the next message start is dropped.
+    """
+
+    Message = 0xaa
+
+    @staticmethod
+    def checksum(data):
+        """ Calculate a checksum over given bytes """
+
+        checksum = 0
+        for byte in data:
+            checksum = (checksum + byte) % 255
+        return checksum
+
+    def __init__(self, frames, messages):
+        self._frames = frames
+        self._messages = messages
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """ Decode all complete frames from the buffer """
+
+        buffer = self._buffer
+        buffer += data
+        offset = 0
+
+        while offset < len(buffer):
+            byte = buffer[offset]
+
+            if byte == Parser.Message:
+                if len(buffer) < offset + 3:
+                    break
+                marker = buffer[offset + 1]
+                end = offset + 3 + buffer[offset + 2] + 1
+                if len(buffer) < end:
+                    break
+
+                # resynchronize on the next message on invalid checksum, the
+                # bytes of a broken message must not be taken as commands
+                checksum = Parser.checksum(buffer[offset + 1:end - 1])
+                if checksum != buffer[end - 1]:
+                    logging.warning(f'invalid checksum for marker {marker}')
+                    offset = buffer.find(Parser.Message, offset + 1)
+                    if offset < 0:
+                        offset = len(buffer)
+                    continue
+
+                content = bytes(buffer[offset + 3:end - 1])
+                offset = end
+
+                handler = self._messages.get(marker)
+                if handler is None:
+                    logging.warning(f'unknown marker: {marker}')
+                    continue
+                handler(content)
+
+            else:
+                frame = self._frames.get(byte)
+                if frame is None:
+                    logging.warning(f'unknown byte {bytes([byte])}')
+                    offset += 1
+                    continue
+
+                length, handler = frame
+                end = offset + 1 + length
+                if len(buffer) < end:
+                    break
+
+                data = bytes(buffer[offset:end])
+                offset = end
+                if handler is not None:
+                    handler(data)
+
+        del buffer[:offset]
@@ -0,0 +1,220 @@
+from core.module import PollingModule
+from core.config import Pin
+from core.journal import journal
+
+import logging
+import pigpio
+
+
+# listeners of named sources (e.g. ADC.P0)
+_listeners = {}
+
+
+def listen(source, callback):
+    """ Register callback(voltage) for every sample of a source """
+    _listeners.setdefault(source, []).append(callback)
+
+
+class Ads1015(PollingModule):
+    """
+    Samples the channels of an ADS1015 analog-to-digital converter
+
+    The converter runs in continuous-conversion mode. By default the latest
+    conversion is polled every "period" seconds, one channel per poll in the
+    order given by "channels" (which may list a channel multiple times to
+    sample it more often).
+
+    With a single channel and an "idle" voltage, the ALERT/RDY pin ("alert")
+    is used instead. The comparator watches the channel while its voltage
+    stays above the idle voltage (e.g. no button pressed), so the bus is
+    silent until the voltage changes. Only then every conversion is read,
+    signalled by the falling edge of the pin, until the voltage is back
+    above the idle voltage. Reading every conversion is not supported
+    without an idle voltage, since it would keep the bus busy at the full
+    conversion rate.
+
+    Samples are published as "<name>.P<channel>" (e.g. ADC.P0).
+    """
+
+    Address = 0x48
+    Rate = 490
+    Release = 4
+
+    REG_CONVERSION = 0x00
+    REG_CONFIG = 0x01
+    REG_LO_THRESH = 0x02
+    REG_HI_THRESH = 0x03
+
+    # full scale range (in volts) and PGA bits by gain
+    Gains = {
+        2/3: (6.144, 0x0000),
+        1: (4.096, 0x0200),
+        2: (2.048, 0x0400),
+        4: (1.024, 0x0600),
+        8: (0.512, 0x0800),
+        16: (0.256, 0x0A00),
+    }
+
+    # data rate bits by samples per second
+    Rates = {
+        128: 0x0000,
+        250: 0x0020,
+        490: 0x0040,
+        920: 0x0060,
+        1600: 0x0080,
+        2400: 0x00A0,
+        3300: 0x00C0,
+    }
+
+    # continuous mode, comparator asserting after one conversion
+    MODE_CONTINUOUS = 0x0000
+    COMP_WINDOW = 0x0010
+    COMP_QUEUE_1 = 0x0000
+    COMP_DISABLE = 0x0003
+
+    Options = (
+        ('alert', False, str, Pin.valid),
+        ('name', False, str, None),
+        ('i2c', False, int, lambda bus: bus >= 0),
+        ('address', False, int, lambda address: 0 <= address < 0x80),
+        ('channels', False, list, lambda channels: channels and all(
+            channel in range(4) for channel in channels)),
+        ('idle', False, (int, float), None),
+        ('release', False, int, lambda release: release >= 1),
+        ('gain', False, (int, float), Gains.__contains__),
+        ('rate', False, int, Rates.__contains__),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        self._name = config.optional('name', 'ADC').value
+        self._bus = config.optional('i2c', 1).value
+        self._address = config.optional('address', Ads1015.Address).value
+        self._channels = config.optional('channels', [0]).value
+        self._idle = config.optional('idle').value
+        self._release = config.optional('release', Ads1015.Release).value
+
+        gain = config.optional('gain', 1).value
+        rate = config.optional('rate', Ads1015.Rate).value
+        if gain not in Ads1015.Gains:
+            raise Exception(f'Invalid gain {gain} for "{self._name}"')
+        if rate not in Ads1015.Rates:
+            raise Exception(f'Invalid rate {rate} for "{self._name}"')
+        if self._idle is not None and len(self._channels) != 1:
+            raise Exception('"idle" requires a single channel')
+        if self._idle is not None and config.optional('alert').value is None:
+            raise Exception('"idle" requires the "alert" pin')
+
+        self._range, pga = Ads1015.Gains[gain]
+        self._config = pga | Ads1015.Rates[rate] | Ads1015.MODE_CONTINUOUS
+        self._sources = [
+            f'{self._name}.P{channel}' for channel in self._channels]
+
+        # sampling state
+        self._index = 0
+        self._watching = False
+        self._quiet = 0
+        self._samples = 0
+
+        self._i2c = pi.i2c_open(self._bus, self._address)
+        if self._idle is None:
+            self._write(Ads1015.REG_CONFIG, self._config
+                        | Ads1015.COMP_DISABLE | self._mux(self._channels[0]))
+            logging.info(f'{self._name} polling {self._sources}')
+            return
+
+        # interrupt driven, only polled on wake
+        self._period = None
+        self._alert = config.pin('alert')
+        pi.set_mode(self._alert.number, pigpio.INPUT)
+        pi.set_pull_up_down(self._alert.number, pigpio.PUD_UP)
+        self._callback = pi.callback(
+            self._alert.number, pigpio.FALLING_EDGE, self._ready)
+
+        self._sample()
+        logging.info(f'{self._name} sampling {self._sources} at {rate}SPS')
+
+    @property
+    def samples(self):
+        """ Gets the number of conversions read """
+        return self._samples
+
+    def _write(self, register, value):
+        self._pi.i2c_write_device(
+            self._i2c, [register, (value >> 8) & 0xFF, value & 0xFF])
+
+    def _mux(self, channel):
+        """ Gets the config bits selecting a single-ended channel """
+        return 0x4000 | (channel << 12)
+
+    def _code(self, voltage):
+        """ Convert a voltage to a (left-aligned) comparator threshold """
+        code = int(voltage / self._range * 2048)
+        return max(-2048, min(2047, code)) << 4 & 0xFFFF
+
+    def _sample(self):
+        """ Signal every conversion on ALERT/RDY """
+
+        self._watching = False
+        self._quiet = 0
+        self._write(Ads1015.REG_HI_THRESH, 0x8000)
+        self._write(Ads1015.REG_LO_THRESH, 0x0000)
+        self._write(Ads1015.REG_CONFIG, self._config | Ads1015.COMP_QUEUE_1
+                    | self._mux(self._channels[self._index]))
+
+    def _watch(self):
+        """ Only signal conversions below the idle voltage """
+
+        self._watching = True
+        self._write(Ads1015.REG_HI_THRESH, 0x7FF0)
+        self._write(Ads1015.REG_LO_THRESH, self._code(self._idle))
+        self._write(Ads1015.REG_CONFIG, self._config | Ads1015.COMP_WINDOW
+                    | Ads1015.COMP_QUEUE_1 | self._mux(self._channels[0]))
+
+    def _read(self):
+        """ Read the latest conversion in volts """
+
+        _, data = self._pi.i2c_read_i2c_block_data(
+            self._i2c, Ads1015.REG_CONVERSION, 2)
+        raw = int.from_bytes(bytes(data), 'big', signed=True) >> 4
+        return raw * self._range / 2048
+
+    def _publish(self, voltage):
+        """ Pass a sample of the current channel to its listeners """
+
+        self._samples += 1
+        for callback in _listeners.get(self._sources[self._index], ()):
+            callback(voltage)
+
+    def poll(self):
+        """ Read the latest conversion and continue with the next channel """
+
+        self._publish(self._read())
+        if len(self._channels) > 1:
+            channel = self._channels[self._index]
+            self._index = (self._index + 1) % len(self._channels)
+            if self._channels[self._index] != channel:
+                self._write(Ads1015.REG_CONFIG, self._config
+                            | Ads1015.COMP_DISABLE
+                            | self._mux(self._channels[self._index]))
+
+    def _ready(self, pin, level, tick):
+        """ Conversion is ready (or voltage left the idle window) """
+
+        if level > 1:
+            # watchdog timeout
+            return
+
+        if self._watching:
+            self._sample()
+            return
+
+        voltage = self._read()
+        self._publish(voltage)
+        self._quiet = self._quiet + 1 if voltage >= self._idle else 0
+        if self._quiet >= self._release:
+            source = self._sources[self._index]
+            logging.debug('%s idle', source)
+            journal.record('ads1015', source, 'idle', voltage)
+            self._watch()
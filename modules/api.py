@@ -1,10 +1,20 @@
 from core.module import Module
+from core.broadcast import Broadcaster
+from core.metrics import metrics
+from core.journal import journal
 
 import logging
 import flask
 
 
 class Api(Module):
+
+    # maximum time to wait for a state change (in seconds)
+    Timeout = 5.0
+
+    # interval of keep-alive messages on idle event streams (in seconds)
+    KeepAlive = 15.0
+
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
 
@@ -17,27 +27,104 @@ class Api(Module):
             "/command",
             view_func=self._post_command,
             methods=['POST'])
+        self._app.add_url_rule(
+            "/commands",
+            view_func=self._post_commands,
+            methods=['POST'])
+        self._app.add_url_rule(
+            "/metrics",
+            view_func=self._get_metrics,
+            methods=['GET'])
+        self._app.add_url_rule(
+            "/log",
+            view_func=self._get_log,
+            methods=['GET'])
+        self._app.add_url_rule(
+            "/events",
+            view_func=self._get_events,
+            methods=['GET'])
+
+        # shared by all event streams
+        self._broadcaster = Broadcaster(state)
 
     def _get_state(self):
         """ Get device state """
 
-        return flask.jsonify({
-            property.name: property.value
-            for property in self._state.properties
-        })
+        _, values = self._state.snapshot()
+        return flask.jsonify(values)
+
+    def _get_metrics(self):
+        """ Export metrics in Prometheus text format """
+
+        return flask.Response(
+            metrics.export(), mimetype='text/plain; version=0.0.4')
+
+    def _get_log(self):
+        """ Get recently recorded events """
+
+        return flask.jsonify(journal.dump())
+
+    def _get_events(self):
+        """ Stream state changes as server-sent events """
+
+        since = flask.request.headers.get(
+            'Last-Event-ID', flask.request.args.get('since'))
+        if since is not None:
+            since = int(since)
+
+        self._broadcaster.start()
+        return flask.Response(
+            self._stream(since),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache'})
+
+    def _stream(self, since):
+        """ Yield frames that are newer than the given version """
+
+        while True:
+            since, frames = self._broadcaster.read(since)
+            yield from frames
+
+            if self._broadcaster.wait_for(since, Api.KeepAlive) <= since:
+                yield b': keep-alive\n\n'
 
     def _post_command(self):
         """ Execute arbitrary command """
         try:
             command = flask.request.json['command']
             params = flask.request.json.get('params', {})
-            self._queue.enqueue(command, **params)
+            version = self._state.version
+            if not self._queue.enqueue(command, **params):
+                return flask.jsonify({'error': 'queue full'}), 503
 
             # command can indicate to wait for actual state change
-            # this can fail, if the command does not issue a change
-            # TODO: add timeout
+            # this times out, if the command does not issue a change
             if flask.request.json.get('wait') == True:
-                self._state.wait()
+                self._state.wait_for(version, Api.Timeout)
+                return self._get_state()
+
+            return flask.jsonify({})
+
+        except:
+            logging.exception('invalid request')
+            return flask.jsonify({}), 400
+
+    def _post_commands(self):
+        """ Execute multiple commands as a single transaction """
+        try:
+            request = flask.request.json
+            if isinstance(request, list):
+                request = {'commands': request}
+
+            version = self._state.version
+            if not self._queue.transact([
+                (item['command'], (), item.get('params', {}))
+                for item in request['commands']
+            ]):
+                return flask.jsonify({'error': 'queue full'}), 503
+
+            if request.get('wait') == True:
+                self._state.wait_for(version, Api.Timeout)
                 return self._get_state()
 
             return flask.jsonify({})
@@ -0,0 +1,294 @@
+from core.module import Module
+from core.broadcast import Broadcaster
+from core.metrics import metrics
+from core.journal import journal
+from core.service import Worker
+
+import urllib.parse
+import asyncio
+import logging
+import json
+import uvicorn
+
+
+class Api(Module):
+    """
+    Provides the web API as asyncio based ASGI application
+
+    Waiting clients do not occupy a thread. The broadcaster thread forwards
+    state changes into the event loop, where all waiting requests are resumed.
+    Next to the endpoints of the api module, GET /state supports long-polling
+    by passing the last known version (?since=<version>). The current version
+    is returned in the X-State-Version header.
+    """
+
+    # interval of keep-alive messages on idle event streams (in seconds)
+    KeepAlive = 15.0
+
+    Options = (
+        ('host', False, str, None),
+        ('port', False, int, lambda port: 0 < port < 65536),
+        ('timeout', False, (int, float), lambda timeout: timeout > 0),
+        ('longpoll', False, (int, float), lambda longpoll: longpoll > 0),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        self._host = config.optional('host', '0.0.0.0').value
+        self._port = config.optional('port', 8000).value
+        self._timeout = config.optional('timeout', 5.0).value
+        self._longpoll = config.optional('longpoll', 30.0).value
+
+        # register all known endpoints
+        self._routes = {
+            ('GET', '/state'): self._get_state,
+            ('POST', '/command'): self._post_command,
+            ('POST', '/commands'): self._post_commands,
+            ('GET', '/log'): self._get_log,
+        }
+        self._texts = {
+            ('GET', '/metrics'): metrics.export,
+        }
+        self._streams = {
+            ('GET', '/events'): self._get_events,
+        }
+
+        # state version as seen by the event loop
+        self._broadcaster = Broadcaster(state)
+        self._version = self._broadcaster.version
+        self._changed = None
+
+        self._server = Worker(self._serve, 'api server')
+        self._server.start()
+
+    def _serve(self, cycle, worker):
+        """ Run the webserver """
+
+        config = uvicorn.Config(
+            self, host=self._host, port=self._port, lifespan='on')
+        uvicorn.Server(config).run()
+
+    def _publish(self, version):
+        """ Wake up all requests waiting for a state change """
+
+        self._version = version
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _wait_for(self, version, timeout):
+        """ Wait until the state is newer than the given version """
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._version <= version:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _get_state(self, query, body):
+        """ Get device state (optionally wait for a newer version) """
+
+        since = query.get('since')
+        if since is not None:
+            timeout = min(
+                float(query.get('timeout', self._longpoll)), self._longpoll)
+            # versions newer than the current one stem from a previous process
+            if int(since) <= self._state.version:
+                await self._wait_for(int(since), timeout)
+
+        version, values = self._state.snapshot()
+        return 200, values, version
+
+    async def _get_log(self, query, body):
+        """ Get recently recorded events """
+
+        return 200, journal.dump(), None
+
+    async def _disconnected(self, receive):
+        """ Wait until the client disconnected """
+
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _get_events(self, scope, receive, send):
+        """ Stream state changes as server-sent events """
+
+        headers = dict(scope['headers'])
+        since = headers.get(b'last-event-id')
+        if since is None:
+            since = self._query(scope).get('since')
+        if since is not None:
+            since = int(since)
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+            ],
+        })
+
+        disconnected = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            while not disconnected.done():
+                since, frames = self._broadcaster.read(since)
+                for frame in frames:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': frame,
+                        'more_body': True,
+                    })
+                if self._version > since:
+                    continue
+
+                changed = asyncio.ensure_future(self._changed.wait())
+                await asyncio.wait(
+                    {changed, disconnected},
+                    timeout=Api.KeepAlive,
+                    return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+
+                if self._version <= since and not disconnected.done():
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b': keep-alive\n\n',
+                        'more_body': True,
+                    })
+        finally:
+            disconnected.cancel()
+
+    async def _post_command(self, query, body):
+        """ Execute arbitrary command """
+
+        request = json.loads(body)
+        command = request['command']
+        params = request.get('params', {})
+        version = self._state.version
+
+        # enqueueing blocks while the queue is full (policy "block")
+        if not await asyncio.to_thread(
+                self._queue.enqueue, command, **params):
+            return 503, {'error': 'queue full'}, None
+
+        # command can indicate to wait for actual state change
+        # this times out, if the command does not issue a change
+        if request.get('wait') == True:
+            await self._wait_for(version, self._timeout)
+            return await self._get_state({}, None)
+
+        return 200, {}, None
+
+    async def _post_commands(self, query, body):
+        """ Execute multiple commands as a single transaction """
+
+        request = json.loads(body)
+        if isinstance(request, list):
+            request = {'commands': request}
+
+        version = self._state.version
+        if not await asyncio.to_thread(self._queue.transact, [
+            (item['command'], (), item.get('params', {}))
+            for item in request['commands']
+        ]):
+            return 503, {'error': 'queue full'}, None
+
+        if request.get('wait') == True:
+            await self._wait_for(version, self._timeout)
+            return await self._get_state({}, None)
+
+        return 200, {}, None
+
+    async def _lifespan(self, receive, send):
+        """ Handle server startup and shutdown """
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                loop = asyncio.get_running_loop()
+                self._changed = asyncio.Event()
+                self._broadcaster.listen(
+                    lambda version: loop.call_soon_threadsafe(
+                        self._publish, version))
+                self._broadcaster.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _respond(self, send, status, payload, version=None):
+        """ Send a JSON response """
+
+        body = json.dumps(payload).encode()
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        if version is not None:
+            headers.append((b'x-state-version', str(version).encode()))
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _query(self, scope):
+        """ Parse query parameters (last value wins) """
+
+        return {
+            key: values[-1] for key, values in
+            urllib.parse.parse_qs(scope['query_string'].decode()).items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        """ ASGI entry point """
+
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        stream = self._streams.get((scope['method'], scope['path']))
+        if stream is not None:
+            return await stream(scope, receive, send)
+
+        text = self._texts.get((scope['method'], scope['path']))
+        if text is not None:
+            body = text().encode()
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/plain; version=0.0.4'),
+                    (b'content-length', str(len(body)).encode()),
+                ],
+            })
+            return await send({'type': 'http.response.body', 'body': body})
+
+        handler = self._routes.get((scope['method'], scope['path']))
+        if handler is None:
+            return await self._respond(send, 404, {})
+
+        # read complete request body
+        body = b''
+        more = True
+        while more:
+            message = await receive()
+            body += message.get('body', b'')
+            more = message.get('more_body', False)
+
+        try:
+            query = self._query(scope)
+            status, payload, version = await handler(query, body)
+            await self._respond(send, status, payload, version)
+
+        except:
+            logging.exception('invalid request')
+            await self._respond(send, 400, {})
@@ -0,0 +1,113 @@
+from core.module import Module
+from core.journal import journal
+from modules.adafruit import ads1015
+
+import logging
+import bisect
+
+
+class Classifier:
+    """
+    Classifies the samples of a single source
+
+    The voltage windows of all buttons on a source are kept as sorted list
+    of bounds, so a sample is classified by a single bisection. A button
+    fires once "limit" consecutive samples fall into its window. Samples of
+    another window first drain the counter, so short glitches neither fire
+    nor release a button.
+    """
+
+    def __init__(self, source, limit):
+        self._source = source
+        self._limit = limit
+        self._bounds = []
+        self._buttons = []
+        self._window = None
+        self._counter = 0
+
+    def add(self, low, high, command, args):
+        index = bisect.bisect_left(self._bounds, low)
+        if index % 2 or index < len(self._bounds) and (
+                self._bounds[index] <= high):
+            raise Exception(
+                f'Overlapping voltage windows [{low}, {high}] on {self._source}')
+
+        self._bounds[index:index] = [low, high]
+        self._buttons.insert(index // 2, (command, args))
+
+    def classify(self, voltage):
+        """ Gets the button whose window contains the voltage (or None) """
+
+        index = bisect.bisect_right(self._bounds, voltage)
+        return index // 2 if index % 2 else None
+
+    def sample(self, voltage):
+        """ Feed a sample, returns the button that fired (or None) """
+
+        window = self.classify(voltage)
+        if window != self._window:
+            if self._counter > 0:
+                self._counter -= 1
+                return None
+            self._window = window
+
+        if self._counter < self._limit:
+            self._counter += 1
+            if self._counter == self._limit and window is not None:
+                return self._buttons[window]
+        return None
+
+
+class Analog(Module):
+    """
+    Buttons multiplexed on an analog input
+
+    Configured as list of buttons, each with a voltage window, a method
+    (see Module._resolve) and the source sampled by an ADC module:
+      - voltage: [0.150, 0.170]
+        method: State.Toggle
+        value: Input
+        source: ADC.P0
+    """
+
+    Limit = 2
+
+    Items = (
+        ('voltage', True, list, lambda voltage: len(voltage) == 2 and all(
+            isinstance(bound, (int, float)) for bound in voltage)
+         and voltage[0] <= voltage[1]),
+        ('source', True, str, None),
+        ('method', True, str, None),
+        ('limit', False, int, lambda limit: limit >= 1),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        self._classifiers = {}
+        for item in config.items():
+            low, high = item.require('voltage').value
+            source = item.require('source').value
+            command, args = self._resolve(
+                item.require('method').value, item.optional('value').value)
+
+            classifier = self._classifiers.get(source)
+            if classifier is None:
+                limit = item.optional('limit', Analog.Limit).value
+                classifier = self._classifiers[source] = Classifier(
+                    source, limit)
+                ads1015.listen(source, self._sampler(source, classifier))
+            classifier.add(low, high, command, args)
+
+        logging.info(f'analog buttons on {", ".join(self._classifiers)}')
+
+    def _sampler(self, source, classifier):
+        def sample(voltage):
+            button = classifier.sample(voltage)
+            if button is not None:
+                command, args = button
+                logging.debug('%s pressed at %.3fV', source, voltage)
+                journal.record('button', command, source, voltage)
+                self.command(command, *args)
+
+        return sample
@@ -0,0 +1,143 @@
+from core.module import Module
+from core.service import Worker
+from modules.input import Input
+
+import logging
+import struct
+import pigpio
+import os
+
+
+class Notifier:
+    """
+    Dispatches edges of many pins from a single notification stream
+
+    Mimics the callback interface of pigpio.pi (all other calls are passed
+    on), so inputs can be attached to it unchanged. Instead of one pigpio
+    callback per pin, the pins are watched by a single notification handle.
+    Its reports are read from the pipe in bulk, changed pins are found by
+    XOR with the previous levels and dispatched to the handlers of each pin.
+    """
+
+    Report = struct.Struct('HHII')
+    Batch = 64
+
+    class Callback:
+        def __init__(self, notifier, gpio, edge, func):
+            self._notifier = notifier
+            self._gpio = gpio
+            self._edge = edge
+            self._func = func
+
+        def cancel(self):
+            handlers = self._notifier._handlers.get(self._gpio, [])
+            if self in handlers:
+                handlers.remove(self)
+
+    def __init__(self, pi):
+        self._pi = pi
+        self._handlers = {}
+        self._bits = 0
+        self._levels = 0
+        self._handle = None
+        self._pipe = None
+        self._reports = 0
+
+    def __getattr__(self, name):
+        return getattr(self._pi, name)
+
+    @property
+    def reports(self):
+        """ Gets the number of reports read """
+        return self._reports
+
+    def callback(self, gpio, edge=pigpio.RISING_EDGE, func=None):
+        callback = Notifier.Callback(self, gpio, edge, func)
+        self._handlers.setdefault(gpio, []).append(callback)
+        self._bits |= 1 << gpio
+        return callback
+
+    def open(self):
+        """ Start notifications for all pins with callbacks """
+
+        self._levels = self._pi.read_bank_1() & self._bits
+        self._handle = self._pi.notify_open()
+
+        # the simulator provides its own pipe
+        pipe = getattr(self._pi, 'notify_pipe', None)
+        if pipe is not None:
+            self._pipe = pipe(self._handle)
+        else:
+            self._pipe = os.open(f'/dev/pigpio{self._handle}', os.O_RDONLY)
+
+        self._pi.notify_begin(self._handle, self._bits)
+
+    def _dispatch(self, levels, tick):
+        """ Call the handlers of all changed pins """
+
+        changed = (levels ^ self._levels) & self._bits
+        self._levels = levels & self._bits
+
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            gpio = bit.bit_length() - 1
+            level = int(bool(levels & bit))
+            edge = pigpio.RISING_EDGE if level else pigpio.FALLING_EDGE
+            for callback in self._handlers[gpio]:
+                if callback._edge in (edge, pigpio.EITHER_EDGE):
+                    callback._func(gpio, level, tick)
+
+    def read(self, cycle, worker):
+        """ Read and dispatch reports until the worker is stopped """
+
+        size = Notifier.Report.size
+        pending = b''
+        while cycle == worker.cycle:
+            data = os.read(self._pipe, size * Notifier.Batch)
+            if not data:
+                break
+
+            data = pending + data
+            end = len(data) - len(data) % size
+            pending = data[end:]
+
+            for _, flags, tick, levels in Notifier.Report.iter_unpack(
+                    data[:end]):
+                self._reports += 1
+                if flags:
+                    # watchdog, keep-alive or event reports
+                    continue
+                self._dispatch(levels, tick)
+
+
+class Hub(Module):
+    """
+    Watches many input pins through a single notification stream
+
+    Configured with a list of "inputs", each configured like an input
+    module. Meant for panels with many buttons, where dispatching every edge
+    through its own pigpio callback becomes expensive.
+    """
+
+    Options = (
+        ('inputs', True, (list, dict), None),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        self._notifier = Notifier(pi)
+        self._inputs = [
+            Input(self._notifier, state, queue, app, item)
+            for item in config.require('inputs').items()
+        ]
+        self._notifier.open()
+
+        logging.info(f'input hub with {len(self._inputs)} pins')
+        self._worker = Worker(self._notifier.read, 'input hub thread')
+        self._worker.start()
+
+    @property
+    def inputs(self):
+        return self._inputs
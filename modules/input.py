@@ -1,10 +1,35 @@
 from core.module import Module
+from core.config import Pin
+from core.metrics import metrics
+from core.journal import journal
 
 import logging
 import pigpio
 
 
 class Input(Module):
+    """
+    Sends a command when a GPIO input pin changes
+
+    Edges are debounced by "debounce" microseconds. By default pigpio's glitch
+    filter is used (the level has to be stable for that long before an edge
+    is reported), "filter: noise" uses its noise filter instead. If the
+    filter is not available or "filter: software" is given, edges closer than
+    the debounce time to the last accepted edge are dropped based on their
+    ticks. Switches also drop edges that do not change the level.
+    """
+
+    Options = (
+        ('pin', True, str, Pin.valid),
+        ('set', True, str, None),
+        ('mode', False, str, ('toggle', 'switch').__contains__),
+        ('edge', False, str, ('falling', 'rising').__contains__),
+        ('debounce', False, int, lambda debounce: debounce >= 0),
+        ('filter', False, str,
+         ('glitch', 'noise', 'software').__contains__),
+        ('active', False, int, lambda active: active >= 0),
+    )
+
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
 
@@ -20,12 +45,71 @@ class Input(Module):
         elif self._edge == 'rising':
             mode = pigpio.RISING_EDGE
 
+        # debouncing
+        self._debounce = config.optional('debounce', 0).value
+        self._filter = config.optional('filter', 'glitch').value
+        self._software = self._debounce > 0 and not self._hardware(
+            self._filter, config.optional('active', self._debounce).value)
+        self._tick = None
+        self._level = None
+        self._suppressed = 0
+        metrics.register(
+            'raspeaker_input_suppressed_total', 'counter',
+            lambda: self._suppressed, 'Number of edges dropped by debouncing',
+            pin=str(self._pin))
+
         # register callback for input pin
         self._callback = pi.callback(self._pin.number, mode, self._change)
         logging.info(f'pin {self._pin} {self._mode}')
 
+    @property
+    def suppressed(self):
+        """ Gets the number of edges dropped by software debouncing """
+        return self._suppressed
+
+    def _hardware(self, filter, active):
+        """ Try to debounce using a pigpio filter """
+
+        try:
+            if filter == 'glitch':
+                self._pi.set_glitch_filter(self._pin.number, self._debounce)
+            elif filter == 'noise':
+                self._pi.set_noise_filter(
+                    self._pin.number, self._debounce, active)
+            elif filter == 'software':
+                return False
+            else:
+                raise Exception(f'Invalid value "{filter}" for "filter"')
+        except pigpio.error as error:
+            logging.warning(
+                f'{filter} filter not available on pin {self._pin}: {error}')
+            return False
+
+        return True
+
+    def _accept(self, level, tick):
+        """ Check whether an edge is a real transition """
+
+        if self._mode == 'switch' and level == self._level:
+            return False
+        if self._software and self._tick is not None and (
+                pigpio.tickDiff(self._tick, tick) < self._debounce):
+            return False
+
+        self._tick = tick
+        self._level = level
+        return True
+
     def _change(self, pin, level, tick):
-        logging.debug(f'pin {pin} changed to {level}')
+        if level > 1:
+            # watchdog timeout
+            return
+        if not self._accept(level, tick):
+            self._suppressed += 1
+            return
+
+        logging.debug('pin %s changed to %s', pin, level)
+        journal.record('input', self._set, pin, level, tick)
 
         if self._mode == 'switch':
             # switch has internal state
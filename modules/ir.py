@@ -0,0 +1,158 @@
+from core.module import Module
+from core.service import Worker
+from core.journal import journal
+
+import selectors
+import logging
+import evdev
+
+
+class Key:
+    """
+    Command bound to an IR keycode
+
+    Repeated events are limited by a token bucket, which refills one token
+    every "bounce" seconds (up to "burst" tokens). The bucket is driven by
+    the event timestamps, so no clock is read. Keys that are not repeatable
+    have to be released for "bounce" seconds before they fire again.
+    """
+
+    def __init__(self, command, args, bounce, repeatable, burst):
+        self._command = command
+        self._args = args
+        self._bounce = bounce
+        self._repeatable = repeatable
+        self._burst = burst
+        self._tokens = burst
+        self._updated = None
+
+    @property
+    def command(self):
+        return self._command
+
+    @property
+    def args(self):
+        return self._args
+
+    def accept(self, timestamp):
+        """ Checks whether an event at the given timestamp fires """
+
+        if self._bounce <= 0:
+            return True
+
+        if self._updated is not None:
+            refill = (timestamp - self._updated) / self._bounce
+            self._tokens = min(self._burst, self._tokens + refill)
+        self._updated = timestamp
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+
+        if not self._repeatable:
+            # holding the key does not fire again
+            self._tokens = 0
+        return False
+
+
+class Ir(Module):
+    """
+    Forwards IR remote keys as commands
+
+    Configured as list of keys (or as mapping with "device" and "keys"):
+      - keycode: 172160
+        method: Power.Toggle      (command power_toggle)
+      - keycode: 172040
+        method: State.Toggle      (command Input_toggle)
+        value: Input
+      - keycode: 172202
+        method: Command.VolumeUp  (command VolumeUp, value as argument)
+        repeatable: True
+        bounce: 0.1
+
+    The receiving thread blocks on the device until events are available,
+    instead of polling it.
+    """
+
+    Device = '/dev/input/event1'
+    Bounce = 0.25
+
+    # mapping form (keys are only checked when given as list)
+    Options = (
+        ('keys', True, list, None),
+        ('device', False, str, None),
+    )
+    Items = (
+        ('keycode', True, int, None),
+        ('method', True, str, None),
+        ('bounce', False, (int, float), lambda bounce: bounce >= 0),
+        ('repeatable', False, bool, None),
+        ('burst', False, (int, float), lambda burst: burst >= 1),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        keys = config
+        device = Ir.Device
+        if isinstance(config.value, dict):
+            keys = config.require('keys')
+            device = config.optional('device', Ir.Device).value
+
+        # compile keymap
+        self._keys = {}
+        for item in keys.items():
+            keycode = item.require('keycode').value
+            self._keys[keycode] = self._compile(item)
+
+        self._device = evdev.InputDevice(device)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._device.fd, selectors.EVENT_READ)
+        logging.info(f'IR receiver {self._device.path}')
+
+        self._worker = Worker(self._loop, 'IR thread')
+        self._worker.start()
+
+    def _compile(self, item):
+        """ Resolve the command of a key """
+
+        command, args = self._resolve(
+            item.require('method').value, item.optional('value').value)
+
+        return Key(
+            command, args,
+            item.optional('bounce', Ir.Bounce).value,
+            item.optional('repeatable', False).value,
+            item.optional('burst', 1).value)
+
+    def _receive(self, event):
+        """ Handle a single input event """
+
+        key = self._keys.get(event.value)
+        if key is None:
+            logging.debug('unknown IR keycode %s', event.value)
+            return
+
+        if not key.accept(event.timestamp()):
+            return
+
+        logging.debug('received IR keycode %s', event.value)
+        journal.record('ir', key.command, event.value)
+        self.command(key.command, *key.args)
+
+    def _loop(self, cycle, worker):
+        """ Wait for IR events and forward them """
+
+        while cycle == worker.cycle:
+            if not self._selector.select():
+                continue
+
+            try:
+                events = list(self._device.read())
+            except BlockingIOError:
+                continue
+
+            for event in events:
+                # scancodes are reported as miscellaneous events
+                if event.type == evdev.ecodes.EV_MSC:
+                    self._receive(event)
@@ -1,4 +1,6 @@
 from core.module import Module
+from core.config import Pin
+from core.journal import journal
 
 import logging
 import pigpio
@@ -7,16 +9,23 @@ import pigpio
 class Output(Module):
     """ Toggles a GPIO output pin """
 
+    Options = (
+        ('state', True, str, None),
+        ('pin', True, str, Pin.valid),
+    )
+
     def __init__(self, pi, state, queue, app, config):
         super().__init__(pi, state, queue, app, config)
 
         self._element = config.require('state').value
         self._pin = config.pin('pin')
+        self._subscribe(self._element)
 
         pi.set_mode(self._pin.number, pigpio.OUTPUT)
         logging.info(f'pin {self._pin} output')
 
-    def update(self):
+    def update(self, changes=None):
         level = self._state.get(self._element) ^ self._pin.invert
-        logging.debug(f'set pin {self._pin.number} to {level}')
+        logging.debug('set pin %s to %s', self._pin.number, level)
+        journal.record('output', self._element, self._pin.number, level)
         self._pi.write(self._pin.number, level)
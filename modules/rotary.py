@@ -0,0 +1,151 @@
+from core.module import Module
+from core.config import Pin
+from core.journal import journal
+
+import logging
+import pigpio
+
+
+class Rotary(Module):
+    """
+    Decodes a quadrature rotary encoder
+
+    Both pins report every edge with its pigpio tick. The levels are tracked
+    from the callbacks (without reading the pins), and each transition is
+    decoded by a Gray-code table, so bounces cancel out and invalid
+    transitions (a missed edge) are ignored. Transitions are accumulated to
+    detents ("steps" transitions each, default 4).
+
+    Every detent sends the "up" or "down" command. If "add" is configured
+    (e.g. Volume.Add), a single add command is sent per detent instead,
+    whose step grows with the rotation speed (in detents per second) up to
+    "acceleration".
+    """
+
+    # change of position by (previous state << 2 | state), states are A << 1 | B
+    Transitions = (
+        0, -1, 1, 0,
+        1, 0, 0, -1,
+        -1, 0, 0, 1,
+        0, 1, -1, 0,
+    )
+
+    Steps = 4
+    Speed = 10.0
+
+    Options = (
+        ('pins', True, (list, dict), lambda pins: len(pins) == 2),
+        ('up', True, str, None),
+        ('down', True, str, None),
+        ('add', False, str, None),
+        ('steps', False, int, lambda steps: steps >= 1),
+        ('speed', False, (int, float), lambda speed: speed > 0),
+        ('acceleration', False, int, lambda acceleration: acceleration >= 1),
+        ('glitch', False, int, lambda glitch: glitch >= 0),
+    )
+
+    def __init__(self, pi, state, queue, app, config):
+        super().__init__(pi, state, queue, app, config)
+
+        pins = config.require('pins').values()
+        if len(pins) != 2:
+            raise Exception('Rotary encoder requires exactly two pins')
+        self._a, self._b = (Pin(str(pin)) for pin in pins)
+
+        self._up = self._resolve(config.require('up').value)
+        self._down = self._resolve(config.require('down').value)
+        self._add = config.optional('add').value
+        if self._add is not None:
+            self._add = self._resolve(self._add)[0]
+
+        self._steps = config.optional('steps', Rotary.Steps).value
+        self._speed = config.optional('speed', Rotary.Speed).value
+        self._acceleration = config.optional('acceleration', 1).value
+        glitch = config.optional('glitch', 0).value
+
+        # decoder state
+        self._position = 0
+        self._tick = None
+        self._velocity = 0.0
+        self._direction = 0
+        self._invalid = 0
+
+        for pin in (self._a, self._b):
+            pi.set_mode(pin.number, pigpio.INPUT)
+            if glitch:
+                pi.set_glitch_filter(pin.number, glitch)
+
+        self._levels = {
+            pin.number: pi.read(pin.number) ^ pin.invert
+            for pin in (self._a, self._b)
+        }
+        self._encoded = self._encode()
+
+        self._callbacks = [
+            pi.callback(pin.number, pigpio.EITHER_EDGE, self._change)
+            for pin in (self._a, self._b)
+        ]
+        logging.info(f'rotary encoder on pins {self._a} and {self._b}')
+
+    @property
+    def velocity(self):
+        """ Gets the current speed in detents per second (signed) """
+        return self._velocity * self._direction
+
+    @property
+    def invalid(self):
+        """ Gets the number of transitions that skipped a state """
+        return self._invalid
+
+    def _encode(self):
+        return (self._levels[self._a.number] << 1) | self._levels[
+            self._b.number]
+
+    def _change(self, pin, level, tick):
+        if level > 1:
+            # watchdog timeout
+            return
+
+        inverted = self._a if pin == self._a.number else self._b
+        self._levels[pin] = level ^ inverted.invert
+
+        previous, self._encoded = self._encoded, self._encode()
+        if previous == self._encoded:
+            return
+
+        delta = Rotary.Transitions[(previous << 2) | self._encoded]
+        if not delta:
+            self._invalid += 1
+            return
+
+        self._position += delta
+        if self._position >= self._steps:
+            self._position -= self._steps
+            self._detent(1, tick)
+        elif self._position <= -self._steps:
+            self._position += self._steps
+            self._detent(-1, tick)
+
+    def _detent(self, direction, tick):
+        """ Handle a complete detent """
+
+        # estimate speed from the time between detents
+        if direction != self._direction or self._tick is None:
+            self._velocity = 0.0
+        else:
+            elapsed = pigpio.tickDiff(self._tick, tick)
+            if elapsed > 0:
+                self._velocity = (self._velocity + 1e6 / elapsed) / 2
+        self._direction = direction
+        self._tick = tick
+
+        journal.record('rotary', direction, tick, self._velocity)
+
+        if self._add is not None:
+            step = min(self._acceleration,
+                       1 + int(self._velocity / self._speed))
+            self.command(self._add, step * direction)
+        elif direction > 0:
+            self.command(self._up[0], *self._up[1])
+        else:
+            self.command(self._down[0], *self._down[1])
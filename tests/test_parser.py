@@ -0,0 +1,56 @@
+from modules.Z906.parser import Parser
+
+
+def message(marker, content):
+    data = bytes([marker, len(content)]) + bytes(content)
+    return b'\xaa' + data + bytes([Parser.checksum(data)])
+
+
+def create():
+    received = []
+    parser = Parser({
+        0x0a: (0, lambda data: received.append(('frame', data))),
+        0x11: (2, lambda data: received.append(('frame', data))),
+    }, {
+        0x0a: lambda content: received.append(('message', content)),
+    })
+    return parser, received
+
+
+def test_frames_and_messages():
+    parser, received = create()
+    parser.feed(b'\x0a' + message(0x0a, [1, 2]) + b'\x11\x01\x02')
+    assert received == [
+        ('frame', b'\x0a'),
+        ('message', b'\x01\x02'),
+        ('frame', b'\x11\x01\x02'),
+    ]
+
+
+def test_split_frames():
+    parser, received = create()
+    data = message(0x0a, [1, 2]) + b'\x11\x01\x02'
+    for index in range(len(data)):
+        parser.feed(data[index:index + 1])
+    assert received == [
+        ('message', b'\x01\x02'),
+        ('frame', b'\x11\x01\x02'),
+    ]
+
+
+def test_invalid_checksum_is_dropped():
+    parser, received = create()
+    parser.feed(b'\xaa\x0a\x02\x01\x02\x00')
+    assert received == []
+
+
+def test_invalid_checksum_resynchronizes():
+    parser, received = create()
+    parser.feed(b'\xaa\x0a\x02\x01\x02\x00' + message(0x0a, [3]))
+    assert received == [('message', b'\x03')]
+
+
+def test_unknown_bytes_are_skipped():
+    parser, received = create()
+    parser.feed(b'\x42' + message(0x0a, []))
+    assert received == [('message', b'')]
@@ -0,0 +1,107 @@
+from core.config import Config
+from core.queue import Queue
+from core.state import State
+from core.module import ConsumingModule
+
+
+def create(commands=(), states=None, **options):
+    queue = Queue(Config(value=list(commands)), Config(value=options))
+    state = State(Config(value=states or {
+        'volume': {'type': 'number', 'range': [0, 100]},
+    }), queue)
+    return queue, state
+
+
+class Consumer(ConsumingModule):
+    def __init__(self, state, queue):
+        super().__init__(None, state, queue, None, Config(value={}))
+
+
+def names(queue):
+    items = []
+    while not queue.drained:
+        item = queue.dequeue()
+        items.append((item.name, item._args))
+    return items
+
+
+def test_coalesce_pending_tail():
+    queue, _ = create()
+    queue.enqueue('volume_set', 10)
+    queue.enqueue('volume_set', 20)
+    assert names(queue) == [('volume_set', (20,))]
+
+
+def test_coalesce_keeps_order():
+    queue, _ = create()
+    queue.enqueue('volume_set', 10)
+    queue.enqueue('volume_inc')
+    queue.enqueue('volume_set', 30)
+    assert [name for name, _ in names(queue)] == [
+        'volume_set', 'volume_inc', 'volume_set']
+
+
+def test_last_write_wins():
+    queue, state = create()
+    consumer = Consumer(state, queue)
+    queue.enqueue('volume_set', 10)
+    queue.enqueue('volume_inc')
+    queue.enqueue('volume_set', 30)
+    consumer.consume()
+    assert state.get('volume') == 30
+
+
+def test_last_write_wins_after_transaction():
+    queue, state = create()
+    consumer = Consumer(state, queue)
+    queue.enqueue('volume_set', 10)
+    queue.transact([('volume_set', (20,), {})])
+    queue.enqueue('volume_set', 50)
+    consumer.consume()
+    assert state.get('volume') == 50
+
+
+def test_priority_lanes():
+    queue, _ = create([{'volume_set': {'priority': 10}}])
+    queue.enqueue('volume_inc')
+    queue.enqueue('volume_dec')
+    queue.enqueue('volume_set', 10)
+    assert [name for name, _ in names(queue)] == [
+        'volume_set', 'volume_inc', 'volume_dec']
+
+
+def test_timestamp_only_for_handlers_taking_it():
+    queue, state = create()
+    received = []
+    consumer = Consumer(state, queue)
+    consumer._register_commands(volume_inc=lambda: received.append('inc'))
+    queue.enqueue('volume_inc')
+    queue.enqueue('volume_dec')
+    consumer.consume()
+    assert received == ['inc']
+    assert state.get('volume') == 0
+
+
+def test_timestamp_accelerates():
+    queue, state = create(states={'volume': {
+        'type': 'number', 'range': [0, 100], 'acceleration': 4}})
+    consumer = Consumer(state, queue)
+    for _ in range(3):
+        queue.enqueue('volume_inc')
+    consumer.consume()
+    assert state.get('volume') == 1 + 4 + 4
+
+
+def test_drop_oldest_of_lowest_priority():
+    queue, _ = create([{'volume_set': {'priority': 10}}], capacity=2)
+    queue.enqueue('volume_set', 10)
+    queue.enqueue('volume_inc')
+    queue.enqueue('volume_dec')
+    assert [name for name, _ in names(queue)] == ['volume_set', 'volume_dec']
+
+
+def test_drop_new_below_pending_priorities():
+    queue, _ = create([{'volume_set': {'priority': 10}}], capacity=1)
+    queue.enqueue('volume_set', 10)
+    assert not queue.enqueue('volume_inc')
+    assert names(queue) == [('volume_set', (10,))]
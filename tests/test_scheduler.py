@@ -0,0 +1,81 @@
+from core.service import Scheduler
+from core import service
+
+
+class Clock:
+    """ Virtual clock, advanced whenever the scheduler sleeps """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def set(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def wait(self, timeout):
+        if timeout is not None:
+            self.now += timeout
+
+
+class Polled:
+    def __init__(self, name, period, polls, duration=0.0, clock=None):
+        self.name = name
+        self.period = period
+        self._polls = polls
+        self._duration = duration
+        self._clock = clock
+
+    def poll(self):
+        self._polls.append((self.name, round(self._clock.now, 3)))
+        self._clock.now += self._duration
+        self._duration = 0.0
+
+
+def run(monkeypatch, modules, until, woken=()):
+    clock = modules[0]._clock
+    monkeypatch.setattr(service.time, 'monotonic', clock.monotonic)
+    scheduler = Scheduler()
+    scheduler._event = clock
+    for module in modules:
+        scheduler.add(module)
+    for module in woken:
+        scheduler.add(module)
+        scheduler.wake(module)
+    scheduler.run(lambda: clock.now < until)
+
+
+def test_periods(monkeypatch):
+    clock, polls = Clock(), []
+    run(monkeypatch, [
+        Polled('slow', 0.2, polls, clock=clock),
+        Polled('fast', 0.1, polls, clock=clock),
+    ], 0.35)
+    assert polls == [
+        ('slow', 0.0), ('fast', 0.0),
+        ('fast', 0.1),
+        ('slow', 0.2), ('fast', 0.2),
+        ('fast', 0.3),
+    ]
+
+
+def test_wake(monkeypatch):
+    clock, polls = Clock(), []
+    run(monkeypatch, [Polled('periodic', 0.1, polls, clock=clock)], 0.15,
+        woken=[Polled('woken', None, polls, clock=clock)])
+    assert polls == [('woken', 0.0), ('periodic', 0.0), ('periodic', 0.1)]
+
+
+def test_missed_periods_are_skipped(monkeypatch):
+    clock, polls = Clock(), []
+    run(monkeypatch, [
+        Polled('stalled', 0.1, polls, duration=0.35, clock=clock),
+    ], 0.6)
+    assert polls == [
+        ('stalled', 0.0), ('stalled', 0.35), ('stalled', 0.45),
+        ('stalled', 0.55),
+    ]
@@ -0,0 +1,72 @@
+from core.config import Config
+from core.queue import Queue
+from core.state import State
+
+import threading
+import pytest
+
+
+def create():
+    queue = Queue(Config(value=[]))
+    state = State(Config(value={
+        'volume': {'type': 'number', 'range': [0, 100]},
+        'power': {'type': 'boolean'},
+    }), queue)
+    return queue, state
+
+
+def test_update():
+    _, state = create()
+    assert state._update('volume', 10)
+    assert not state._update('volume', 10)
+    assert state.get('volume') == 10
+    assert state.version == 1
+
+
+def test_transaction_applies_at_once():
+    _, state = create()
+    with state._transaction():
+        state._update('volume', 10)
+        state._update('power', True)
+
+        # staged changes are only visible to the executing thread
+        assert state.get('volume') == 10
+        assert state.snapshot() == (0, {'volume': 0, 'power': False})
+
+    assert state.snapshot() == (2, {'volume': 10, 'power': True})
+
+
+def test_transaction_revert():
+    _, state = create()
+    state._update('volume', 5)
+    with pytest.raises(Exception):
+        with state._transaction():
+            state._update('volume', 10)
+            state._update('power', True)
+            raise Exception('failed')
+
+    assert state.snapshot() == (1, {'volume': 5, 'power': False})
+
+
+def test_transaction_does_not_block_readers():
+    _, state = create()
+    result = []
+    with state._transaction():
+        state._update('volume', 10)
+        reader = threading.Thread(
+            target=lambda: result.append(state.get('volume')))
+        reader.start()
+        reader.join(1.0)
+
+    assert result == [0]
+    assert state.get('volume') == 10
+
+
+def test_handlers_see_staged_values():
+    queue, state = create()
+    with state._transaction():
+        for command, args in (('volume_set', (10,)), ('volume_inc', ())):
+            Queue.Command(command, queue.commands[command], args, {}).execute(
+                resolve=queue.commands.get)
+
+    assert state.get('volume') == 11